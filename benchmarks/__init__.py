@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks for the demo API. Run a module with ``python -m``, e.g.: ::
+
+    $ python -m benchmarks.marshalling
+"""
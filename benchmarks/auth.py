@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Compare authenticated requests per second under Basic auth, with and
+without the credential cache, against bearer tokens.
+
+Basic auth without the cache hashes the password on every request; bearer
+tokens are checked by their signature.
+"""
+
+import time
+
+from demo import create_app
+from demo.database import db
+from demo.models.task import Task
+from demo.models.user import User
+from demo.settings import TestConfig
+
+from .batch import auth_headers
+
+URL = '/api/users/bench/tasks'
+SECONDS = 3.0
+
+
+def make_app(auth_cache_size):
+    class BenchConfig(TestConfig):
+        AUTH_CACHE_SIZE = auth_cache_size
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        user = User.create(username='bench', email='bench@example.com',
+                           password='bench')
+        Task.bulk_create([{'user_id': user.id, 'summary': 'Task %d' % i}
+                          for i in range(10)])
+        User.recount_tasks()
+        db.session.commit()
+    return app
+
+
+def basic(client):
+    return auth_headers('bench', 'bench')
+
+
+def token(client):
+    response = client.post('/api/tokens', headers=basic(client))
+    assert response.status_code == 200, response.status_code
+    return {'Authorization': 'Bearer ' + response.get_json()['token'],
+            'Content-Type': 'application/json'}
+
+
+def measure(client, headers, seconds):
+    requests = 0
+    start = time.time()
+    while time.time() - start < seconds:
+        response = client.get(URL, headers=headers, data='{}')
+        assert response.status_code == 200, response.status_code
+        requests += 1
+    return requests, time.time() - start
+
+
+def run(seconds=SECONDS):
+    results = []
+    for name, auth_cache_size, login in (
+            ('basic', 0, basic),
+            ('basic-cached', 1024, basic),
+            ('token', 1024, token)):
+        app = make_app(auth_cache_size)
+        client = app.test_client()
+        requests, elapsed = measure(client, login(client), seconds)
+        results.append({
+            'mode': name,
+            'requests': requests,
+            'requests_per_second': requests / elapsed,
+        })
+    return results
+
+
+def main():
+    print('%14s %10s %10s' % ('mode', 'requests', 'req/s'))
+    for r in run():
+        print('%14s %10d %10.1f' % (
+            r['mode'], r['requests'], r['requests_per_second']))
+
+
+if __name__ == '__main__':
+    main()
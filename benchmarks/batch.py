@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Compare creating tasks one POST at a time against a single batch request.
+
+Uses a file-backed SQLite database so that every commit is a real
+transaction with an fsync.
+"""
+
+import base64
+import json
+import os
+import tempfile
+import time
+
+from demo import create_app
+from demo.database import db
+from demo.models.user import User
+from demo.settings import TestConfig
+
+TASKS = 500
+
+
+def make_app(path):
+    class BenchConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{0}'.format(path)
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        User.create(username='bench', email='bench@example.com',
+                    password='bench')
+    return app
+
+
+def auth_headers(username, password):
+    credentials = '{0}:{1}'.format(username, password).encode('utf-8')
+    return {
+        'Authorization': 'Basic ' + base64.b64encode(credentials).decode(),
+        'Content-Type': 'application/json',
+    }
+
+
+def single(client, headers, count):
+    for i in range(count):
+        body = json.dumps({'summary': 'Task %d' % i})
+        response = client.post('/api/users/1/tasks', data=body,
+                               headers=headers)
+        assert response.status_code == 201, response.status_code
+    return count
+
+
+def batch(client, headers, count):
+    body = json.dumps([{'op': 'create', 'summary': 'Task %d' % i}
+                       for i in range(count)])
+    response = client.post('/api/users/1/tasks/batch', data=body,
+                           headers=headers)
+    assert response.status_code == 200, response.status_code
+    return 1
+
+
+def run(count=TASKS):
+    results = []
+    headers = auth_headers('bench', 'bench')
+    for name, func in (('single', single), ('batch', batch)):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            app = make_app(path)
+            client = app.test_client()
+            start = time.time()
+            commits = func(client, headers, count)
+            elapsed = time.time() - start
+        finally:
+            os.remove(path)
+        results.append({
+            'mode': name,
+            'tasks': count,
+            'seconds': elapsed,
+            'tasks_per_second': count / elapsed,
+            'commits': commits,
+        })
+    return results
+
+
+def main():
+    print('%8s %8s %10s %10s %8s' % ('mode', 'tasks', 'seconds', 'tasks/s',
+                                     'commits'))
+    for r in run():
+        print('%8s %8d %10.3f %10.1f %8d' % (
+            r['mode'], r['tasks'], r['seconds'], r['tasks_per_second'],
+            r['commits']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Measure the CPU cost and the bytes saved by compressing task collection
+pages of typical sizes with gzip and brotli at several levels.
+
+Pages are marshalled and encoded as compact JSON the way the API sends
+them. Brotli rows are skipped when the package is not installed.
+"""
+
+from __future__ import division, print_function
+
+from demo.api.task import task_collection_fields
+from demo.compression import compress, brotli
+from demo.marshalling import compile_fields
+from demo.representations import JSON_BACKENDS
+
+from .marshalling import best_of, make_page
+
+PAGE_SIZES = (1, 20, 100)
+LEVELS = [('gzip', level) for level in (1, 6, 9)]
+if brotli is not None:
+    LEVELS += [('br', level) for level in (1, 4, 11)]
+
+
+def run():
+    serialize = compile_fields(task_collection_fields)
+    dumps = next(iter(JSON_BACKENDS.values()))
+    results = []
+    for size in PAGE_SIZES:
+        body = dumps(serialize(make_page(size)))
+        number = max(1, 1000 // size)
+        for encoding, level in LEVELS:
+            compressed = compress(body, encoding, level)
+            results.append({
+                'items': size,
+                'encoding': encoding,
+                'level': level,
+                'bytes': len(body),
+                'compressed_bytes': len(compressed),
+                'saved': 1 - len(compressed) / len(body),
+                'compress_ms': best_of(
+                    lambda: compress(body, encoding, level), number) * 1000,
+            })
+    return results
+
+
+def main():
+    print('%6s %-5s %5s %8s %8s %7s %8s' % (
+        'items', 'enc', 'level', 'bytes', 'out', 'saved', 'ms'))
+    for r in run():
+        print('%6d %-5s %5d %8d %8d %6.1f%% %8.3f' % (
+            r['items'], r['encoding'], r['level'], r['bytes'],
+            r['compressed_bytes'], r['saved'] * 100, r['compress_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""Throughput and latency benchmarks for the API endpoints.
+
+Seeds a throwaway SQLite database with ``--users`` users owning ``--tasks``
+tasks each, then drives the app through a set of scenarios, either
+in-process through the WSGI test client or over HTTP against a local
+gunicorn started with ``gunicorn.conf.py``. For every scenario it reports
+p50/p95/p99 latency, requests per second and SQL queries per request.
+
+Results can be saved as JSON and compared between commits: ::
+
+    $ python -m benchmarks.load --output before.json
+    $ git checkout my-branch
+    $ python -m benchmarks.load --output after.json --compare before.json
+    $ python -m benchmarks.load --server gunicorn --concurrency 8
+
+The database is a temporary SQLite file unless ``--database`` names
+another one, such as a scratch PostgreSQL database; its tables are dropped
+and recreated.
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # pragma: no cover
+    from httplib import HTTPConnection
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+from demo import create_app
+from demo.database import db
+from demo.models.task import Task
+from demo.models.user import User
+from demo.settings import TestConfig
+
+PASSWORD = 'bench'
+
+# Query count reported by demo.instrumentation
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class BenchConfig(TestConfig):
+    """Test settings against the file database named by BENCH_DATABASE_URI.
+    """
+    DEBUG = False
+    SQLALCHEMY_DATABASE_URI = os.getenv('BENCH_DATABASE_URI', 'sqlite://')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Pool sized for the worker class, as in production
+    DB_SERVER_POOL = not SQLALCHEMY_DATABASE_URI.startswith('sqlite')
+
+
+def bench_app():
+    """App factory for gunicorn: ``benchmarks.load:bench_app()``."""
+    return create_app(BenchConfig)
+
+
+def seed(app, users, tasks):
+    """Create ``users`` users with ``tasks`` tasks each."""
+    # One hash for everybody, hashing every password would dominate seeding
+    password_hash = generate_password_hash(PASSWORD)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        User.bulk_create([{
+            'username': 'user%d' % i,
+            'email': 'user%d@example.com' % i,
+            'password_hash': password_hash,
+        } for i in range(1, users + 1)], commit=False)
+        for user_id in range(1, users + 1):
+            Task.bulk_create([{
+                'user_id': user_id,
+                'summary': 'Task %d' % i,
+                'description': 'Description of task %d' % i,
+                'complete': bool(i % 3 == 0),
+            } for i in range(tasks)], commit=False)
+        User.recount_tasks()
+        db.session.commit()
+
+
+def auth_headers(user_id):
+    credentials = 'user{0}:{1}'.format(user_id, PASSWORD).encode('utf-8')
+    return {
+        'Authorization': 'Basic ' + base64.b64encode(credentials).decode(),
+        'Content-Type': 'application/json',
+    }
+
+
+# Each scenario returns (method, path, body, headers) for a random request
+def task_list(rng, users, tasks):
+    user = rng.randint(1, users)
+    return 'GET', '/api/users/%d/tasks' % user, None, auth_headers(user)
+
+
+def task_get(rng, users, tasks):
+    user = rng.randint(1, users)
+    task = (user - 1) * tasks + rng.randint(1, tasks)
+    path = '/api/users/%d/tasks/%d' % (user, task)
+    return 'GET', path, None, auth_headers(user)
+
+
+def task_create(rng, users, tasks):
+    user = rng.randint(1, users)
+    body = json.dumps({'summary': 'New task', 'description': 'Created'})
+    return 'POST', '/api/users/%d/tasks' % user, body, auth_headers(user)
+
+
+def user_page(rng, users, tasks):
+    pages = max(1, users // 20)
+    path = '/api/users?per_page=20&page=%d' % rng.randint(1, pages)
+    return 'GET', path, None, {}
+
+
+SCENARIOS = {
+    'task_list': task_list,
+    'task_get': task_get,
+    'task_create': task_create,
+    'user_page': user_page,
+}
+
+
+class InProcessClient(object):
+    """Issues requests through the WSGI test client and counts queries."""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+        self.queries = 0
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.queries += 1
+
+    def request(self, method, path, body, headers):
+        response = self.client.open(path, method=method, data=body,
+                                    headers=headers)
+        return response.status_code
+
+
+class HTTPClient(object):
+    """Issues requests over keep-alive HTTP connections, one per thread, and
+    counts queries from the Server-Timing headers of the responses.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.local = threading.local()
+        self.queries = 0
+        self.lock = threading.Lock()
+
+    def request(self, method, path, body, headers):
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = HTTPConnection(self.host, self.port)
+        connection = self.local.connection
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        except (socket.error, IOError):
+            del self.local.connection
+            raise
+        match = SERVER_TIMING_QUERIES.search(
+            response.getheader('Server-Timing', ''))
+        if match:
+            with self.lock:
+                self.queries += int(match.group(1))
+        return response.status
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, int(round(fraction * len(ordered) + 0.5)) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def run_scenario(client, scenario, requests, concurrency, users, tasks,
+                 seed_value=0):
+    latencies, errors = [], []
+    lock = threading.Lock()
+    queries_before = client.queries
+
+    def worker(count, rng):
+        for _ in range(count):
+            method, path, body, headers = scenario(rng, users, tasks)
+            start = time.time()
+            status = client.request(method, path, body, headers)
+            elapsed = time.time() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors.append(status)
+
+    per_thread = [requests // concurrency] * concurrency
+    per_thread[0] += requests - sum(per_thread)
+    threads = [threading.Thread(target=worker,
+                                args=(n, random.Random(seed_value + i)))
+               for i, n in enumerate(per_thread)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.time() - start
+
+    latencies.sort()
+    result = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': wall,
+        'requests_per_second': len(latencies) / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'queries_per_request': None,
+    }
+    if client.queries is not None:
+        result['queries_per_request'] = \
+            (client.queries - queries_before) / len(latencies)
+    return result
+
+
+def wait_for_port(host, port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start listening on %d' % port)
+
+
+def start_gunicorn(database_uri, port, extra_env=None, wait=True):
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                        os.pardir))
+    env = dict(os.environ, PORT=str(port), BENCH_DATABASE_URI=database_uri,
+               GUNICORN_LOG_LEVEL='warning', **(extra_env or {}))
+    env.pop('GUNICORN_RELOAD', None)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+         '--access-logfile', '/dev/null', 'benchmarks.load:bench_app()'],
+        cwd=root, env=env)
+    if not wait:
+        return process
+    try:
+        wait_for_port('127.0.0.1', port)
+    except Exception:
+        process.terminate()
+        raise
+    return process
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    path = None
+    database_uri = args.database
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_uri = 'sqlite:///{0}'.format(path)
+    os.environ['BENCH_DATABASE_URI'] = database_uri
+    BenchConfig.SQLALCHEMY_DATABASE_URI = database_uri
+    process = None
+    try:
+        app = bench_app()
+        seed(app, args.users, args.tasks)
+        if args.server == 'gunicorn':
+            process = start_gunicorn(database_uri, args.port, {
+                'GUNICORN_WORKER_CLASS': args.worker_class,
+                'WEB_CONCURRENCY': str(args.workers),
+            })
+            client = HTTPClient('127.0.0.1', args.port)
+        else:
+            client = InProcessClient(app)
+
+        results = {}
+        for name in args.scenarios:
+            # Warm up caches and connections before measuring
+            run_scenario(client, SCENARIOS[name], min(50, args.requests),
+                         args.concurrency, args.users, args.tasks)
+            results[name] = run_scenario(
+                client, SCENARIOS[name], args.requests, args.concurrency,
+                args.users, args.tasks)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if path is not None:
+            os.remove(path)
+
+    return {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': sys.version.split()[0],
+        'server': args.server,
+        'worker_class': args.worker_class,
+        'workers': args.workers,
+        'users': args.users,
+        'tasks': args.tasks,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'scenarios': results,
+    }
+
+
+def report(results, baseline=None):
+    print('%-12s %9s %9s %9s %9s %9s %7s' % (
+        'scenario', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries',
+        'errors'))
+    for name, r in sorted(results['scenarios'].items()):
+        queries = r['queries_per_request']
+        print('%-12s %9.1f %9.2f %9.2f %9.2f %9s %7d' % (
+            name, r['requests_per_second'], r['p50_ms'], r['p95_ms'],
+            r['p99_ms'], '-' if queries is None else '%.1f' % queries,
+            r['errors']))
+        old = (baseline or {}).get('scenarios', {}).get(name)
+        if old:
+            print('%-12s %+8.1f%% %+8.1f%% %+8.1f%% %+8.1f%%' % (
+                '  vs %s' % (baseline.get('revision') or 'baseline'),
+                change(old['requests_per_second'], r['requests_per_second']),
+                change(old['p50_ms'], r['p50_ms']),
+                change(old['p95_ms'], r['p95_ms']),
+                change(old['p99_ms'], r['p99_ms'])))
+
+
+def change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=200,
+                        help='tasks per user')
+    parser.add_argument('--requests', type=int, default=1000,
+                        help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--server', choices=('inprocess', 'gunicorn'),
+                        default='inprocess')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--worker-class', choices=('sync', 'gevent'),
+                        default='sync', help='gunicorn worker class')
+    parser.add_argument('--workers', type=int, default=3,
+                        help='gunicorn worker processes')
+    parser.add_argument('--database',
+                        help='database URI to use instead of a temporary '
+                             'SQLite file; its tables are dropped')
+    parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+                        default=sorted(SCENARIOS))
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON results to compare against')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
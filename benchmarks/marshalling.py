@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Compare flask_restful.marshal against the precompiled serializers on task
+collection pages of 1, 100 and 1000 items.
+"""
+
+import json
+import timeit
+
+from flask_restful import marshal
+
+from demo.api.task import task_collection_fields
+from demo.marshalling import compile_fields
+from demo.models.task import Task
+
+PAGE_SIZES = (1, 100, 1000)
+
+
+def make_page(size):
+    items = [Task(id=i, user_id=1, complete=bool(i % 2),
+                  summary='Task %d' % i, description='Description ' * 10)
+             for i in range(1, size + 1)]
+    meta = {
+        'page': 1,
+        'per_page': size,
+        'total': size,
+        'pages': 1,
+        'links': {'first': '/api/users/1/tasks?page=1'},
+    }
+    return {'items': items, 'meta': meta}
+
+
+def best_of(func, number, repeat=5):
+    """Best time in seconds for one call of ``func``."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def run():
+    serialize = compile_fields(task_collection_fields)
+    results = []
+    for size in PAGE_SIZES:
+        page = make_page(size)
+        assert (json.dumps(serialize(page)) ==
+                json.dumps(marshal(page, task_collection_fields)))
+        number = max(1, 2000 // size)
+        stock = best_of(lambda: marshal(page, task_collection_fields), number)
+        compiled = best_of(lambda: serialize(page), number)
+        results.append({
+            'items': size,
+            'marshal_ms': stock * 1000,
+            'compiled_ms': compiled * 1000,
+            'speedup': stock / compiled,
+        })
+    return results
+
+
+def main():
+    print('%8s %12s %12s %8s' % ('items', 'marshal ms', 'compiled ms', 'x'))
+    for r in run():
+        print('%8d %12.3f %12.3f %8.1f' % (
+            r['items'], r['marshal_ms'], r['compiled_ms'], r['speedup']))
+
+
+if __name__ == '__main__':
+    main()
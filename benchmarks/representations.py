@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Compare encode time and payload size of the response representations on
+marshalled task collection pages of 1, 100 and 1000 items.
+
+The ``json pretty`` row is the indented stdlib output Flask-RESTful
+produces in debug mode; the others are what ``demo.representations`` can
+send. Backends that are not installed are skipped.
+"""
+
+from __future__ import print_function
+
+import json
+
+from demo.api.task import task_collection_fields
+from demo.marshalling import compile_fields
+from demo.representations import JSON_BACKENDS, msgpack
+
+from .marshalling import PAGE_SIZES, best_of, make_page
+
+
+def encoders():
+    yield 'json pretty', lambda data: json.dumps(data, indent=4).encode()
+    for name, dumps in JSON_BACKENDS.items():
+        yield name, dumps
+    if msgpack is not None:
+        yield 'msgpack', lambda data: msgpack.packb(data, use_bin_type=True)
+
+
+def run():
+    serialize = compile_fields(task_collection_fields)
+    results = []
+    for size in PAGE_SIZES:
+        page = serialize(make_page(size))
+        number = max(1, 2000 // size)
+        for name, encode in encoders():
+            results.append({
+                'items': size,
+                'encoder': name,
+                'encode_ms': best_of(lambda: encode(page), number) * 1000,
+                'bytes': len(encode(page)),
+            })
+    return results
+
+
+def main():
+    print('%8s %-12s %10s %10s' % ('items', 'encoder', 'encode ms', 'bytes'))
+    for r in run():
+        print('%8d %-12s %10.3f %10d' % (
+            r['items'], r['encoder'], r['encode_ms'], r['bytes']))
+
+
+if __name__ == '__main__':
+    main()
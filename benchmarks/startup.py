@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Measure startup cost and worker memory with and without preloading.
+
+Reports how long ``import demo`` and ``create_app()`` take in a fresh
+interpreter, then starts gunicorn in each mode and reports the time from
+launch to the first successful request and, after ``--requests`` requests
+spread over the workers, the private memory (USS) of each worker. Memory is
+read from ``/proc``, so it is only reported on Linux. ::
+
+    $ python -m benchmarks.startup --workers 4
+"""
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:  # pragma: no cover
+    from httplib import HTTPConnection
+
+from . import load
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+IMPORT_SCRIPT = '''
+import time
+start = time.time()
+import demo
+imported = time.time()
+demo.create_app()
+print(imported - start, time.time() - imported)
+'''
+
+MODES = (
+    ('workers', {'GUNICORN_PRELOAD': 'false'}),
+    ('preload', {'GUNICORN_PRELOAD': 'true', 'GUNICORN_GC_FREEZE': 'false'}),
+    ('preload+freeze', {'GUNICORN_PRELOAD': 'true',
+                        'GUNICORN_GC_FREEZE': 'true'}),
+)
+
+
+def import_times(repeat=5):
+    """Best seconds to ``import demo`` and to call ``create_app()``."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT],
+                                         cwd=ROOT)
+        runs.append([float(value) for value in output.split()])
+    return min(run[0] for run in runs), min(run[1] for run in runs)
+
+
+def first_request(port, timeout=60):
+    """Poll until a request succeeds, returning when it did."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        connection = HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', '/api/users')
+            if connection.getresponse().status == 200:
+                return time.time()
+        except (socket.error, IOError):
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.01)
+    raise RuntimeError('gunicorn did not answer on %d' % port)
+
+
+def children(pid):
+    """Process ids whose parent is ``pid``."""
+    found = []
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % name) as f:
+                # The command name may contain spaces, the fields after it
+                # don't
+                fields = f.read().rsplit(')', 1)[1].split()
+        except (IOError, OSError):
+            continue
+        if int(fields[1]) == pid:
+            found.append(int(name))
+    return found
+
+
+def uss(pid):
+    """Private (unshared) memory of a process in bytes."""
+    private = 0
+    path = '/proc/%d/smaps_rollup' % pid
+    if not os.path.exists(path):
+        path = '/proc/%d/smaps' % pid
+    with open(path) as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                private += int(line.split()[1]) * 1024
+    return private
+
+
+def measure(mode_env, database_uri, args):
+    env = dict(mode_env, WEB_CONCURRENCY=str(args.workers))
+    start = time.time()
+    process = load.start_gunicorn(database_uri, args.port, env, wait=False)
+    try:
+        ready = first_request(args.port)
+        # Several connections so that every worker serves some requests
+        client = load.HTTPClient('127.0.0.1', args.port)
+        load.run_scenario(client, load.user_page, args.requests,
+                          args.workers * 2, args.users, args.tasks)
+        memory = None
+        if os.path.isdir('/proc/%d' % process.pid):
+            workers = children(process.pid)
+            memory = sum(uss(pid) for pid in workers) / len(workers)
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'first_request_ms': (ready - start) * 1000,
+        'worker_uss_mb': memory and memory / 2 ** 20,
+    }
+
+
+def run(args):
+    results = {}
+    results['import_ms'], results['create_app_ms'] = [
+        seconds * 1000 for seconds in import_times()]
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    database_uri = 'sqlite:///{0}'.format(path)
+    load.BenchConfig.SQLALCHEMY_DATABASE_URI = database_uri
+    try:
+        load.seed(load.bench_app(), args.users, args.tasks)
+        results['modes'] = [(name, measure(env, database_uri, args))
+                            for name, env in MODES]
+    finally:
+        os.remove(path)
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tasks', type=int, default=10,
+                        help='tasks per user')
+    parser.add_argument('--port', type=int, default=5099)
+    return parser
+
+
+def main(argv=None):
+    results = run(build_parser().parse_args(argv))
+    print('import demo   %8.1f ms' % results['import_ms'])
+    print('create_app()  %8.1f ms' % results['create_app_ms'])
+    print()
+    print('%-16s %18s %16s' % ('mode', 'first request ms', 'worker USS MB'))
+    for name, r in results['modes']:
+        uss_mb = r['worker_uss_mb']
+        print('%-16s %18.1f %16s' % (
+            name, r['first_request_ms'],
+            '%.1f' % uss_mb if uss_mb is not None else 'n/a'))
+
+
+if __name__ == '__main__':
+    main()
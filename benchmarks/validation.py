@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Compare flask_restful.reqparse against the precompiled BodyParser on the
+task write endpoints.
+
+Reports the time to parse one request body, then the mean and median
+latency of ``POST /api/users/1/tasks`` (create) and
+``POST /api/users/1/tasks/<id>`` (update) through the test client with
+each parser in place of ``demo.api.task.task_parser``.
+"""
+
+from __future__ import division, print_function
+
+import json
+import time
+
+from flask_restful import reqparse
+
+from demo import create_app
+from demo.api import task as task_api
+from demo.database import db
+from demo.models.user import User
+from demo.settings import TestConfig
+
+from .batch import auth_headers
+from .marshalling import best_of
+
+REQUESTS = 1000
+
+BODY = json.dumps({'summary': 'Write the docs',
+                   'description': 'All of them', 'complete': False})
+
+
+def reqparse_parser():
+    parser = reqparse.RequestParser()
+    parser.add_argument('complete', type=bool)
+    parser.add_argument('summary', type=str, required=True)
+    parser.add_argument('description', type=str)
+    return parser
+
+
+PARSERS = (
+    ('reqparse', reqparse_parser()),
+    ('compiled', task_api.task_parser),
+)
+
+
+def make_app():
+    class BenchConfig(TestConfig):
+        DEBUG = False
+        SERVER_TIMING = False
+    app = create_app(BenchConfig)
+    with app.app_context():
+        db.create_all()
+        User.create(username='bench', email='bench@example.com',
+                    password='bench')
+    return app
+
+
+def latencies(client, headers, path, count):
+    times = []
+    for _ in range(count):
+        start = time.time()
+        response = client.post(path, data=BODY, headers=headers)
+        times.append(time.time() - start)
+        assert response.status_code in (200, 201), response.status_code
+    times.sort()
+    return sum(times) / count * 1000, times[count // 2] * 1000
+
+
+def run(count=REQUESTS):
+    app = make_app()
+    client = app.test_client()
+    headers = auth_headers('bench', 'bench')
+    # Warm the credential cache
+    client.post('/api/users/1/tasks', data=BODY, headers=headers)
+
+    results = []
+    try:
+        for name, parser in PARSERS:
+            task_api.task_parser = parser
+            with app.test_request_context('/', method='POST', data=BODY,
+                                          headers=headers):
+                parse = best_of(parser.parse_args, 10000) * 1e6
+            create = latencies(client, headers, '/api/users/1/tasks', count)
+            update = latencies(client, headers, '/api/users/1/tasks/1', count)
+            results.append({
+                'parser': name,
+                'parse_us': parse,
+                'create_mean_ms': create[0],
+                'create_p50_ms': create[1],
+                'update_mean_ms': update[0],
+                'update_p50_ms': update[1],
+            })
+    finally:
+        task_api.task_parser = PARSERS[-1][1]
+    return results
+
+
+def main():
+    print('%-10s %10s %12s %12s %12s %12s' % (
+        'parser', 'parse us', 'create ms', 'create p50', 'update ms',
+        'update p50'))
+    for r in run():
+        print('%-10s %10.1f %12.3f %12.3f %12.3f %12.3f' % (
+            r['parser'], r['parse_us'], r['create_mean_ms'],
+            r['create_p50_ms'], r['update_mean_ms'], r['update_p50_ms']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""Compare concurrent throughput of ``/api/users/<id>/tasks`` under sync
+and gevent gunicorn workers.
+
+Runs the ``task_list`` scenario of :mod:`benchmarks.load` against gunicorn
+once per worker class, with the same number of workers and client
+threads. The gain from gevent depends on time spent waiting for the
+database, so point ``--database`` at a PostgreSQL scratch database on
+another host to see it; with the default SQLite file queries never leave
+the process and both classes are CPU bound. ::
+
+    $ python -m benchmarks.workers --database postgresql://localhost/bench
+"""
+
+from __future__ import print_function
+
+from . import load
+
+
+def main(argv=None):
+    parser = load.build_parser()
+    parser.set_defaults(server='gunicorn', concurrency=32, workers=2,
+                        scenarios=['task_list'])
+    args = parser.parse_args(argv)
+
+    results = {}
+    for worker_class in ('sync', 'gevent'):
+        args.worker_class = worker_class
+        results[worker_class] = load.run(args)['scenarios']['task_list']
+
+    print('%-8s %9s %9s %9s %9s %7s' % (
+        'workers', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+    for worker_class, r in sorted(results.items(), reverse=True):
+        print('%-8s %9.1f %9.2f %9.2f %9.2f %7d' % (
+            worker_class, r['requests_per_second'], r['p50_ms'],
+            r['p95_ms'], r['p99_ms'], r['errors']))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,20 @@ import os
 
 from flask import Flask
 
-from demo.settings import ProdConfig, DevConfig
+from demo.settings import ProdConfig, DevConfig, engine_options
 from demo.extensions import (
     db,
     migrate,
     opbeat,
+    credential_cache,
+    token_cache,
+    response_cache,
+    count_cache,
+    instrumentation,
+    metrics,
+    compression,
 )
+from demo.database import unit_of_work
 from demo.api import api_blueprint
 
 if os.getenv("FLASK_ENV") == 'prod':
@@ -27,6 +35,8 @@ def create_app(config_object=DefaultConfig):
     '''
     app = Flask(__name__)
     app.config.from_object(config_object)
+    if app.config['DB_SERVER_POOL']:
+        app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options())
     opbeat.init_app(app)
     register_extensions(app)
     register_blueprints(app)
@@ -34,8 +44,18 @@ def create_app(config_object=DefaultConfig):
 
 
 def register_extensions(app):
+    # First, so its after_request hook runs last and sees the whole request
+    instrumentation.init_app(app)
+    metrics.init_app(app)
+    # Its after_request hook runs after the commit, and is timed
+    compression.init_app(app)
     db.init_app(app)
     migrate.init_app(app, db)
+    credential_cache.init_app(app)
+    token_cache.init_app(app)
+    response_cache.init_app(app)
+    count_cache.init_app(app)
+    unit_of_work.init_app(app)
 
 
 def register_blueprints(app):
@@ -3,8 +3,11 @@
 from flask import Blueprint
 from flask_restful import Api, fields
 
+from demo.representations import register_representations
+
 api_blueprint = Blueprint("api", __name__, url_prefix='/api')
 api = Api(api_blueprint)
+register_representations(api)
 
 # Marshaled fields for links in meta section
 link_fields = {
@@ -14,12 +17,14 @@ link_fields = {
     'last': fields.String,
 }
 
-# Marshaled fields for meta section
+# Marshaled fields for meta section. Counts are null when not computed, and
+# estimated when they come from the query planner.
 meta_fields = {
-    'page': fields.Integer,
+    'page': fields.Integer(default=None),
     'per_page': fields.Integer,
-    'total': fields.Integer,
-    'pages': fields.Integer,
+    'total': fields.Integer(default=None),
+    'pages': fields.Integer(default=None),
+    'estimated': fields.Boolean,
     'links': fields.Nested(link_fields)
 }
 
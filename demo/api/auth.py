@@ -1,16 +1,106 @@
 #!/usr/bin/env python
 
 import functools
-from flask import g, abort
-from demo.extensions import auth
+import hashlib
+import hmac
+import os
+from flask import current_app, g, abort
+from flask_restful import Resource
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy.exc import InvalidRequestError
+from demo.api import api
+from demo.database import db
+from demo.extensions import basic_auth, token_auth, credential_cache, \
+    token_cache
 from demo.models.user import User
 
+# Random key, so cached digests are useless outside this server. Made at
+# import: a preloaded app's workers share the master's
+_digest_key = os.urandom(32)
 
-@auth.verify_password
+
+def _password_digest(password):
+    return hmac.new(_digest_key, password.encode('utf-8'),
+                    hashlib.sha256).digest()
+
+
+def _token_serializer():
+    return URLSafeTimedSerializer(
+        current_app.config['SECRET_KEY'], salt='auth-token',
+        signer_kwargs={'digest_method': hashlib.sha256})
+
+
+def generate_token(user):
+    """Return a signed bearer token carrying the user's id and password
+    version.
+    """
+    return _token_serializer().dumps([user.id, user.password_version])
+
+
+@basic_auth.verify_password
 def verify_password(username, password):
-    """Validate user passwords and store user in the 'g' object"""
-    g.user = User.query.filter_by(username=username).first()
-    return g.user is not None and g.user.check_password(password)
+    """Validate user passwords and store user in the 'g' object.
+
+    Cache hits are not checked against the database: after a password
+    change in another worker, the old password works here until the entry
+    expires (``AUTH_CACHE_TTL``).
+    """
+    digest = _password_digest(password)
+    cached = credential_cache.get(username)
+    if cached is not None and hmac.compare_digest(cached[0], digest):
+        g.user = User.from_snapshot(cached[1])
+        g.user_cached = True
+        # Views looking the caller up again get this instance
+        g.user.remember()
+        return True
+
+    g.user = User.get_by_username(username)
+    if g.user is None or not g.user.check_password(password):
+        return False
+    credential_cache.set(username, (digest, g.user.snapshot()))
+    return True
+
+
+@token_auth.verify_token
+def verify_token(token):
+    """Validate bearer tokens and store user in the 'g' object. Only the
+    signature is checked, the user comes from the cache when possible.
+    """
+    try:
+        user_id, version = _token_serializer().loads(
+            token, max_age=current_app.config['AUTH_TOKEN_TTL'])
+    except (BadSignature, TypeError, ValueError):
+        return False
+
+    cached = token_cache.get(user_id)
+    if cached is not None and cached['password_version'] == version:
+        g.user = User.from_snapshot(cached)
+        g.user_cached = True
+        g.user.remember()
+        return True
+
+    g.user = User.get_by_id(user_id)
+    if g.user is None or g.user.password_version != version:
+        return False
+    token_cache.set(user_id, g.user.snapshot())
+    return True
+
+
+def fresh_user():
+    """Return the authenticated user, reloaded from the database if it was
+    rebuilt from an auth cache entry.
+
+    Cache entries are per worker and may be up to ``AUTH_CACHE_TTL`` old:
+    good enough to authenticate with, but not to write from or respond
+    with after a write.
+    """
+    if g.pop('user_cached', False):
+        try:
+            db.session.refresh(g.user)
+        except InvalidRequestError:
+            # Deleted since it was cached
+            abort(404)
+    return g.user
 
 
 def self_only(func):
@@ -24,3 +114,17 @@ def self_only(func):
                 abort(403)
         return func(*args, **kwargs)
     return wrapper
+
+
+class TokenResource(Resource):
+    # Only a password can issue tokens, so they can't renew themselves
+    decorators = [basic_auth.login_required]
+
+    def post(self):
+        return {
+            'token': generate_token(g.user),
+            'expires_in': current_app.config['AUTH_TOKEN_TTL'],
+        }
+
+
+api.add_resource(TokenResource, '/tokens')
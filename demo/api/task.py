@@ -1,22 +1,42 @@
 #!/usr/bin/env python
 
-from flask import abort
-from flask_restful import Resource, reqparse, marshal_with, fields
+from flask import abort, current_app, g, request, stream_with_context
+from flask_restful import Resource, reqparse, fields, inputs
+from sqlalchemy.orm.exc import StaleDataError
 
 from demo.api import api, meta_fields
 from demo.api.auth import self_only
+from demo.compat import string_types
+from demo.database import db, commit_session
 from demo.models.task import Task
 from demo.models.user import User
-from demo.helpers import paginate
+from demo.helpers import paginate, conditional, load_fields
+from demo.instrumentation import query_budget
+from demo.marshalling import marshal_with, compile_fields
+from demo.representations import dumps
+from demo.validation import BodyParser
 from demo.extensions import auth
 
-task_parser = reqparse.RequestParser()
+task_parser = BodyParser()
 task_parser.add_argument('complete', type=bool)
 task_parser.add_argument('summary', type=str, required=True)
 task_parser.add_argument('description', type=str)
 
 task_collection_parser = reqparse.RequestParser()
-task_collection_parser.add_argument('complete', type=int)
+# 1/0 or true/false
+task_collection_parser.add_argument('complete', type=inputs.boolean,
+                                    location='args')
+task_collection_parser.add_argument('summary_prefix', location='args')
+task_collection_parser.add_argument('summary_contains', location='args')
+task_collection_parser.add_argument('min_id', type=int, location='args')
+task_collection_parser.add_argument('max_id', type=int, location='args')
+
+task_export_parser = task_collection_parser.copy()
+task_export_parser.add_argument('format', choices=('jsonl', 'json'),
+                                default='jsonl', location='args')
+
+# Rows fetched per round trip when streaming an export
+EXPORT_BATCH_SIZE = 1000
 
 
 # Marshaled field definitions for task objects
@@ -35,38 +55,104 @@ task_collection_fields = {
 }
 
 
+def get_own_task(task_id, options=()):
+    """Return the caller's task ``task_id``, aborting with 404 if there is
+    no such task or it belongs to another user.
+    """
+    task = Task.query.options(*options) \
+        .filter_by(id=task_id, user_id=g.user.id).first()
+    if task is None:
+        abort(404)
+    return task
+
+
+def own_task_etag(task_id=0, **kwargs):
+    return Task.etag_for(id=task_id, user_id=g.user.id)
+
+
+def filter_tasks(query, args):
+    """Narrow a task query by the task collection URL arguments, so that
+    filtering happens in SQL before the query is paginated.
+    """
+    if args['complete'] is not None:
+        query = query.filter(Task.complete == args['complete'])
+    if args['summary_prefix']:
+        query = query.filter(
+            Task.summary.startswith(args['summary_prefix'], autoescape=True))
+    if args['summary_contains']:
+        query = query.filter(
+            Task.summary.contains(args['summary_contains'], autoescape=True))
+    if args['min_id'] is not None:
+        query = query.filter(Task.id >= args['min_id'])
+    if args['max_id'] is not None:
+        query = query.filter(Task.id <= args['max_id'])
+    return query
+
+
+# Attributes a batch operation may set, with their accepted JSON types
+batch_task_attributes = {
+    'complete': (bool, int),
+    'summary': string_types,
+    'description': string_types,
+}
+
+
+def parse_batch_operation(operation):
+    """Validate one operation of a task batch.
+
+    Returns ``(parsed, error)``; ``parsed`` is a dict with the ``op``, the
+    task ``id`` (for updates and deletes) and the attribute ``values``.
+    """
+    if not isinstance(operation, dict):
+        return None, 'Operation must be an object'
+
+    op = operation.get('op')
+    if op not in ('create', 'update', 'delete'):
+        return None, "'op' must be one of create, update, delete"
+
+    values = {}
+    if op != 'delete':
+        for name, types in batch_task_attributes.items():
+            value = operation.get(name)
+            if value is None:
+                continue
+            if not isinstance(value, types):
+                return None, "Invalid value for '{0}'".format(name)
+            values[name] = bool(value) if name == 'complete' else value
+
+    if op == 'create':
+        if 'summary' not in values:
+            return None, "Missing required parameter 'summary'"
+        return {'op': op, 'values': values}, None
+
+    id = operation.get('id')
+    if not isinstance(id, int) or isinstance(id, bool):
+        return None, "Missing required parameter 'id'"
+    return {'op': op, 'id': id, 'values': values}, None
+
+
 class TaskResource(Resource):
     decorators = [
         self_only,
         auth.login_required,
     ]
 
-    @marshal_with(task_fields)
+    # Authentication, the entity tag lookup for a stale If-None-Match and
+    # the task
+    @query_budget(3)
+    @marshal_with(task_fields, sparse=True)
+    @conditional(own_task_etag)
     def get(self, task_id=0, **kwargs):
-        task = Task.get_by_id(task_id)
-
-        if not task:
-            abort(404)
-
-        return task
+        return get_own_task(task_id, load_fields(Task, task_fields))
 
     @marshal_with(task_fields)
     def post(self, task_id=0, **kwargs):
-        task = Task.get_by_id(task_id)
-
-        if not task:
-            abort(404)
-
+        task = get_own_task(task_id)
         task.update(**task_parser.parse_args())
         return task
 
     def delete(self, task_id=0, **kwargs):
-        task = Task.get_by_id(task_id)
-
-        if not task:
-            abort(404)
-
-        task.delete()
+        get_own_task(task_id).delete()
         return 204
 
 
@@ -76,7 +162,10 @@ class TaskCollectionResource(Resource):
         auth.login_required,
     ]
 
-    @marshal_with(task_collection_fields)
+    # Authentication (which loads the user), the count (a planner estimate,
+    # then an exact count if it is below COUNT_ESTIMATE_MIN) and the page
+    @query_budget(4)
+    @marshal_with(task_collection_fields, sparse='items')
     @paginate()
     def get(self, user_id=None, username=None):
         # Find user that task goes with
@@ -89,15 +178,27 @@ class TaskCollectionResource(Resource):
         if not user:
             abort(404)
 
-        # Get the user's tasks
-        tasks = Task.query.filter_by(user_id=user.id)
+        # Get the user's tasks, in a stable order so pages don't overlap
+        tasks = Task.query.options(*load_fields(Task, task_fields)) \
+            .filter_by(user_id=user.id).order_by(Task.id)
 
         args = task_collection_parser.parse_args()
-        # fancy url argument query filtering!
-        if args['complete'] is not None:
-            tasks.filter_by(complete=args['complete'])
 
-        return tasks
+        def counter():
+            # The user's denormalized counts cover all tasks and open tasks
+            # only. Tasks with a NULL completion count as neither open nor
+            # complete, so complete ones can't be derived from the two.
+            if args['summary_prefix'] or args['summary_contains'] or \
+                    args['min_id'] is not None or args['max_id'] is not None:
+                return None
+            if args['complete'] is None:
+                return user.task_count
+            if args['complete']:
+                return None
+            return user.open_task_count
+
+        # fancy url argument query filtering!
+        return filter_tasks(tasks, args), counter
 
     @marshal_with(task_fields)
     def post(self, user_id=None, username=None):
@@ -108,7 +209,153 @@ class TaskCollectionResource(Resource):
         return task, 201
 
 
+class TaskBatchResource(Resource):
+    """Apply a JSON array of create/update/delete operations to the user's
+    tasks in a single transaction. Either every operation is valid and all
+    are applied, or nothing is and a 400 lists the errors by index.
+    """
+    decorators = [
+        self_only,
+        auth.login_required,
+    ]
+
+    def post(self, user_id=None, username=None):
+        operations = request.get_json(silent=True)
+        if not isinstance(operations, list):
+            abort(400)
+        if len(operations) > current_app.config['TASK_BATCH_MAX']:
+            abort(413)
+
+        parsed, errors = [], []
+        for index, operation in enumerate(operations):
+            operation, error = parse_batch_operation(operation)
+            if error:
+                errors.append({'index': index, 'message': error})
+            parsed.append(operation)
+
+        # Updates and deletes may only target the caller's own tasks, once
+        ids = [op['id'] for op in parsed if op and op['op'] != 'create']
+        versions = {}
+        if ids:
+            versions = dict(db.session.query(Task.id, Task.version)
+                            .filter(Task.user_id == g.user.id,
+                                    Task.id.in_(set(ids))))
+        seen = set()
+        for index, op in enumerate(parsed):
+            if not op or op['op'] == 'create':
+                continue
+            if op['id'] not in versions:
+                error = 'Task {0} not found'.format(op['id'])
+            elif op['id'] in seen:
+                error = 'Task {0} appears more than once'.format(op['id'])
+            else:
+                seen.add(op['id'])
+                continue
+            errors.append({'index': index, 'message': error})
+
+        if errors:
+            errors.sort(key=lambda e: e['index'])
+            return {'message': 'Invalid batch operations',
+                    'errors': errors}, 400
+
+        creates, updates, deletes = [], [], []
+        for op in parsed:
+            if op['op'] == 'create':
+                op['row'] = dict(op['values'], user_id=g.user.id)
+                creates.append(op['row'])
+            elif op['op'] == 'update' and op['values']:
+                # The loaded version, which the UPDATE checks and increments
+                updates.append(dict(op['values'], id=op['id'],
+                                    version=versions[op['id']]))
+                op['version'] = versions[op['id']] + 1
+            elif op['op'] == 'delete':
+                deletes.append(op['id'])
+
+        try:
+            if creates:
+                Task.bulk_create(creates, commit=False)
+            if updates:
+                Task.bulk_update(updates, commit=False)
+            if deletes:
+                Task.bulk_delete(deletes, commit=False)
+            # Bulk operations bypass the ORM listeners keeping the counts
+            User.recount_tasks(g.user.id)
+            commit_session()
+        except StaleDataError:
+            # A task changed since its version was read
+            db.session.rollback()
+            abort(409)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        results = []
+        for op in parsed:
+            if op['op'] == 'create':
+                results.append({'op': 'create', 'status': 201,
+                                'id': op['row']['id'], 'version': 1})
+            elif op['op'] == 'update':
+                results.append({'op': 'update', 'status': 200,
+                                'id': op['id'],
+                                'version': op.get('version',
+                                                  versions[op['id']])})
+            else:
+                results.append({'op': 'delete', 'status': 204,
+                                'id': op['id']})
+        return {'items': results}, 200
+
+
+class TaskExportResource(Resource):
+    """Stream all of a user's tasks, optionally filtered like the task
+    collection, as JSON Lines (default) or as a single JSON array.
+
+    Rows are read in batches through a server-side cursor as plain column
+    tuples and serialized one at a time, so memory use does not grow with
+    the number of tasks.
+    """
+    decorators = [
+        self_only,
+        auth.login_required,
+    ]
+
+    serialize = staticmethod(compile_fields(task_fields))
+
+    def get(self, user_id=None, username=None):
+        args = task_export_parser.parse_args()
+        columns = [getattr(Task, name) for name in task_fields]
+        query = filter_tasks(
+            Task.query.filter_by(user_id=g.user.id).order_by(Task.id), args)
+        rows = query.with_entities(*columns) \
+            .execution_options(stream_results=True) \
+            .yield_per(EXPORT_BATCH_SIZE)
+
+        keys = list(task_fields)
+        serialize = self.serialize
+
+        def lines():
+            for row in rows:
+                yield dumps(serialize(dict(zip(keys, row)))) + b'\n'
+
+        def array():
+            separator = b'[\n'
+            for row in rows:
+                yield separator + dumps(serialize(dict(zip(keys, row))))
+                separator = b',\n'
+            yield b'[]\n' if separator == b'[\n' else b'\n]\n'
+
+        if args['format'] == 'json':
+            body, mimetype = array(), 'application/json'
+        else:
+            body, mimetype = lines(), 'application/x-ndjson'
+        return current_app.response_class(stream_with_context(body),
+                                          mimetype=mimetype)
+
+
 api.add_resource(TaskResource, '/users/<int:user_id>/tasks/<int:task_id>',
                  '/users/<username>/tasks/<int:task_id>')
 api.add_resource(TaskCollectionResource, '/users/<int:user_id>/tasks',
                  '/users/<username>/tasks')
+api.add_resource(TaskBatchResource, '/users/<int:user_id>/tasks/batch',
+                 '/users/<username>/tasks/batch')
+api.add_resource(TaskExportResource, '/users/<int:user_id>/tasks/export',
+                 '/users/<username>/tasks/export')
@@ -1,15 +1,18 @@
 #!/usr/bin/env python
 
-from flask import abort, g
-from flask_restful import Resource, reqparse, marshal_with, fields
+from flask import abort
+from flask_restful import Resource, fields
 
 from demo.api import api, meta_fields
-from demo.api.auth import self_only
+from demo.api.auth import fresh_user, self_only
 from demo.models.user import User
-from demo.helpers import paginate
-from demo.extensions import auth
+from demo.helpers import paginate, conditional, load_fields
+from demo.instrumentation import query_budget
+from demo.marshalling import marshal_with
+from demo.extensions import auth, response_cache
+from demo.validation import BodyParser
 
-user_parser = reqparse.RequestParser()
+user_parser = BodyParser()
 user_parser.add_argument('username')
 user_parser.add_argument('password')
 user_parser.add_argument('email')
@@ -33,14 +36,25 @@ user_collection_fields = {
 }
 
 
+def user_etag(user_id=None, username=None):
+    if username is not None:
+        return User.etag_for(username=username)
+    return User.etag_for(id=user_id)
+
+
 class UserResource(Resource):
-    @marshal_with(user_fields)
+    # The entity tag lookup for a stale If-None-Match, and the user
+    @query_budget(2)
+    @response_cache.cached(api, 'users')
+    @marshal_with(user_fields, sparse=True)
+    @conditional(user_etag)
     def get(self, user_id=None, username=None):
         user = None
+        options = load_fields(User, user_fields)
         if username is not None:
-            user = User.get_by_username(username)
+            user = User.get_by_username(username, options)
         else:
-            user = User.get_by_id(user_id)
+            user = User.get_by_id(user_id, options)
 
         if not user:
             abort(404)
@@ -51,21 +65,26 @@ class UserResource(Resource):
     @self_only
     @marshal_with(user_fields)
     def post(self, user_id=None, username=None):
-        g.user.update(**user_parser.parse_args())
-        return g.user
+        user = fresh_user()
+        user.update(**user_parser.parse_args())
+        return user
 
     @auth.login_required
     @self_only
     def delete(self, user_id=None, username=None):
-        g.user.delete()
+        fresh_user().delete()
         return 204
 
 
 class UserCollectionResource(Resource):
-    @marshal_with(user_collection_fields)
+    # The count (a planner estimate, then an exact count if it is below
+    # COUNT_ESTIMATE_MIN) and the page
+    @query_budget(3)
+    @response_cache.cached(api, 'users')
+    @marshal_with(user_collection_fields, sparse='items')
     @paginate()
     def get(self):
-        users = User.query
+        users = User.query.options(*load_fields(User, user_fields))
         return users
 
     @marshal_with(user_fields)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""Bulk import of users and tasks.
+
+Records are streamed from JSON lines or CSV files (picked by the ``.csv``
+extension) and inserted a batch at a time, with ``COPY`` on PostgreSQL and
+an executemany elsewhere, so memory use does not grow with the input.
+
+User records have ``username``, ``email`` and either ``password`` or an
+already hashed ``password_hash``, plus optional ``first_name`` and
+``last_name``. Passwords are hashed by a process pool, the next batch while
+the current one is inserted.
+
+Task records name their owner by ``user_id`` or ``username``, plus
+optional ``summary``, ``description`` and ``complete``. Usernames are
+resolved with one query per batch.
+
+Everything is imported in a single transaction.
+"""
+
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import time
+
+from sqlalchemy import select
+from werkzeug.security import generate_password_hash
+
+from .compat import PY2, text_type
+from .database import changed_models, db
+from .models.task import Task
+from .models.user import User
+
+BATCH_SIZE = 5000
+
+USER_COLUMNS = ('username', 'email', 'password_hash', 'first_name',
+                'last_name')
+TASK_COLUMNS = ('user_id', 'summary', 'description', 'complete')
+
+# Keeps IN lists under SQLite's variable limit
+_LOOKUP_CHUNK = 500
+
+
+def read_records(path):
+    """Yield the records of a JSON lines or CSV file as dicts."""
+    if path.endswith('.csv'):
+        if PY2:  # pragma: no cover
+            with open(path, 'rb') as f:
+                for row in csv.DictReader(f):
+                    # Columns missing from short rows are None
+                    yield dict((key, value and value.decode('utf-8') or None)
+                               for key, value in row.items())
+        else:
+            with io.open(path, encoding='utf-8', newline='') as f:
+                for row in csv.DictReader(f):
+                    yield dict((key, value or None)
+                               for key, value in row.items())
+    else:
+        with io.open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batches(iterable, size):
+    """Split an iterable into lists of ``size`` items."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _boolean(value):
+    if value is None or isinstance(value, bool):
+        return value
+    return text_type(value).lower() in ('1', 'true', 'yes')
+
+
+# Backslash first, so the escapes added after it are left alone
+_COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'),
+                 ('\r', '\\r'))
+
+
+def _copy_value(value):
+    """Format a value as a field of ``COPY``'s text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    value = text_type(value)
+    for char, escaped in _COPY_ESCAPES:
+        value = value.replace(char, escaped)
+    return value
+
+
+def _copy_buffer(rows):
+    """Return a file of ``rows`` in ``COPY``'s text format, in which
+    ``\\N`` is NULL and any other field, even an empty one, is a value.
+    """
+    data = u''.join(u'\t'.join(_copy_value(value) for value in row) + u'\n'
+                    for row in rows)
+    if PY2:  # pragma: no cover
+        return io.BytesIO(data.encode('utf-8'))
+    return io.StringIO(data)
+
+
+def insert_rows(connection, table, columns, rows):
+    """Insert ``rows``, tuples of values for ``columns``, into ``table``.
+
+    Uses ``COPY`` through psycopg2 on PostgreSQL and an executemany
+    elsewhere.
+    """
+    if connection.dialect.driver == 'psycopg2':
+        statement = 'COPY {0} ({1}) FROM STDIN'.format(
+            table.name, ', '.join(columns))
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(statement, _copy_buffer(rows))
+        finally:
+            cursor.close()
+    else:
+        connection.execute(table.insert(),
+                           [dict(zip(columns, row)) for row in rows])
+
+
+def _user_rows(batch, hashes):
+    hashes = iter(hashes)
+    return [(record['username'], record['email'],
+             record.get('password_hash') or next(hashes),
+             record.get('first_name'), record.get('last_name'))
+            for record in batch]
+
+
+def _hashed_user_batches(records, batch_size, pool):
+    # One batch is hashed by the pool while the caller inserts the previous
+    pending = None
+    for batch in batches(records, batch_size):
+        passwords = []
+        for record in batch:
+            if not record.get('password_hash'):
+                if not record.get('password'):
+                    raise ValueError('User {0!r} has no password'.format(
+                        record.get('username')))
+                passwords.append(record['password'])
+        chunksize = max(1, len(passwords) //
+                        (multiprocessing.cpu_count() * 4))
+        result = pool.map_async(generate_password_hash, passwords, chunksize)
+        if pending is not None:
+            yield _user_rows(pending[0], pending[1].get())
+        pending = batch, result
+    if pending is not None:
+        yield _user_rows(pending[0], pending[1].get())
+
+
+def import_users(connection, records, pool, batch_size=BATCH_SIZE,
+                 progress=None):
+    """Insert user ``records``, hashing their passwords with the
+    ``multiprocessing`` ``pool``, and return how many there were.
+
+    ``progress`` is called with the running total after every batch.
+    """
+    total = 0
+    for rows in _hashed_user_batches(records, batch_size, pool):
+        insert_rows(connection, User.__table__, USER_COLUMNS, rows)
+        total += len(rows)
+        if progress is not None:
+            progress(total)
+    return total
+
+
+def _user_ids(connection, usernames):
+    users = User.__table__
+    usernames = list(usernames)
+    ids = {}
+    for start in range(0, len(usernames), _LOOKUP_CHUNK):
+        chunk = usernames[start:start + _LOOKUP_CHUNK]
+        ids.update(connection.execute(
+            select([users.c.username, users.c.id])
+            .where(users.c.username.in_(chunk))).fetchall())
+    return ids
+
+
+def _task_rows(connection, batch):
+    usernames = set(record.get('username') for record in batch
+                    if record.get('user_id') is None)
+    ids = _user_ids(connection, usernames) if usernames else {}
+    rows = []
+    for record in batch:
+        user_id = record.get('user_id')
+        if user_id is None:
+            user_id = ids.get(record.get('username'))
+            if user_id is None:
+                raise ValueError('Task owner {0!r} does not exist'.format(
+                    record.get('username')))
+        rows.append((int(user_id), record.get('summary'),
+                     record.get('description'),
+                     bool(_boolean(record.get('complete')))))
+    return rows
+
+
+def import_tasks(connection, records, batch_size=BATCH_SIZE,
+                 progress=None):
+    """Insert task ``records``, returning how many there were.
+
+    ``progress`` is called with the running total after every batch.
+    """
+    total = 0
+    for batch in batches(records, batch_size):
+        rows = _task_rows(connection, batch)
+        insert_rows(connection, Task.__table__, TASK_COLUMNS, rows)
+        total += len(rows)
+        if progress is not None:
+            progress(total)
+    return total
+
+
+def import_files(users=None, tasks=None, batch_size=BATCH_SIZE,
+                 processes=None, progress=None):
+    """Import users, then tasks, from the given files in one transaction
+    and bring the users' task counts up to date.
+
+    Returns ``(kind, rows, seconds)`` for each file. ``progress`` is called
+    with the kind, the running total and the seconds elapsed after every
+    batch.
+    """
+    # Forked before connecting, so workers don't inherit the connection
+    pool = multiprocessing.Pool(processes)
+    # Manager commands run in a GET request context, which reads from
+    # replicas
+    db.pin_primary()
+    connection = db.session.connection()
+    results = []
+    try:
+        for kind, path in (('users', users), ('tasks', tasks)):
+            if path is None:
+                continue
+            start = time.time()
+
+            def report(total):
+                if progress is not None:
+                    progress(kind, total, time.time() - start)
+
+            records = read_records(path)
+            if kind == 'users':
+                rows = import_users(connection, records, pool, batch_size,
+                                    report)
+            else:
+                rows = import_tasks(connection, records, batch_size, report)
+            results.append((kind, rows, time.time() - start))
+        if tasks is not None:
+            User.recount_tasks()
+        # Rows were inserted around the unit of work
+        changed_models().update((User, Task))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
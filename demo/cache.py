@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""In-process caching utilities.
+
+Caches are per worker process: every gunicorn worker keeps its own copy, so
+entries should be safe to serve stale for up to their time-to-live.
+"""
+
+import functools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, request
+from flask_restful.utils import unpack
+from werkzeug.wrappers import Response as BaseResponse
+
+from sqlalchemy.sql.util import find_tables
+
+from .signals import model_changed
+
+# Python 2 has no monotonic clock in the stdlib
+_now = getattr(time, 'monotonic', time.time)
+
+
+class TTLCache(object):
+    """A bounded, thread-safe LRU mapping whose entries expire after a fixed
+    time-to-live.
+
+    Sized and timed from the app config in :meth:`init_app` using
+    ``<PREFIX>_SIZE`` and ``<PREFIX>_TTL``. A size of zero disables the cache.
+
+    Usage: ::
+
+        cache = TTLCache('AUTH_CACHE')
+        cache.init_app(app)
+        cache.set('key', 'value')
+        cache.get('key')
+    """
+
+    def __init__(self, config_prefix, maxsize=1024, ttl=300, timer=_now,
+                 sizeof=None):
+        self.config_prefix = config_prefix
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        # Optional function giving the size in bytes of a value
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get(self.config_prefix + '_SIZE',
+                                      self.maxsize)
+        self.ttl = app.config.get(self.config_prefix + '_TTL', self.ttl)
+        self.clear()
+
+    def get(self, key, default=None):
+        """Return the live value for ``key``, counting a hit or a miss."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > self.timer():
+                    # Mark as most recently used
+                    del self._data[key]
+                    self._data[key] = entry
+                    self.hits += 1
+                    return value
+                self._discard(key)
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store ``value``, evicting the least recently used entry if full."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._discard(key)
+            while len(self._data) >= self.maxsize:
+                self._discard(next(iter(self._data)))
+            self._data[key] = (self.timer() + self.ttl, value)
+            if self.sizeof is not None:
+                self.bytes += self.sizeof(value)
+
+    def invalidate(self, key):
+        """Drop ``key`` from the cache if present."""
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.bytes = 0
+
+    def _discard(self, key):
+        # Callers hold the lock
+        entry = self._data.pop(key, None)
+        if entry is not None and self.sizeof is not None:
+            self.bytes -= self.sizeof(entry[1])
+
+    def stats(self):
+        """Return a dict of counters describing the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'bytes': self.bytes,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GenerationalCache(object):
+    """Base for caches of values derived from the database.
+
+    Entries are stored in a backend with ``get(key)``, ``set(key, value)``,
+    ``invalidate(key)``, ``clear()`` and ``stats()`` methods, by default a
+    per-process :class:`TTLCache`; pass any object with the same methods
+    (such as a client for a cache shared between workers, or another
+    :class:`TTLCache` standing in for one) as ``backend``.
+
+    Every key includes a generation token per namespace, kept in the
+    backend itself. Committing a change to a model whose table name
+    matches a namespace replaces its token, which orphans all of its
+    entries at once without having to enumerate them. Entries computed
+    from what was read before the commit were keyed with the old token, so
+    they are never served after it.
+    """
+
+    #: Config prefix of the default backend, and its default size and TTL
+    config_prefix = None
+    maxsize = 512
+    ttl = 60
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.enabled = True
+        # Value lookups only, the backend also counts generation lookups
+        self.hits = 0
+        self.misses = 0
+        model_changed.connect(self._model_changed)
+
+    def init_app(self, app, backend=None):
+        if backend is not None:
+            self.backend = backend
+        elif self.backend is None:
+            self.backend = self.default_backend()
+        if hasattr(self.backend, 'init_app'):
+            self.backend.init_app(app)
+        self.enabled = app.config.get(self.config_prefix + '_SIZE', 1) > 0
+
+    def default_backend(self):
+        return TTLCache(self.config_prefix, maxsize=self.maxsize, ttl=self.ttl)
+
+    def generation(self, namespace):
+        token = self.backend.get('generation:' + namespace)
+        if token is None:
+            # A fresh random token, so an evicted one never revives old keys
+            token = self.invalidate(namespace)
+        return token
+
+    def invalidate(self, namespace):
+        """Orphan every entry cached under ``namespace``."""
+        token = uuid.uuid4().hex
+        self.backend.set('generation:' + namespace, token)
+        return token
+
+    def _model_changed(self, model):
+        if self.backend is not None:
+            self.invalidate(model.__tablename__)
+
+    def stats(self):
+        """Return the backend's stats with value hit counts and rate."""
+        stats = dict(self.backend.stats())
+        lookups = self.hits + self.misses
+        stats.update(hits=self.hits, misses=self.misses,
+                     hit_rate=float(self.hits) / lookups if lookups else 0.0)
+        return stats
+
+
+class ResponseCache(GenerationalCache):
+    """Caches serialized responses of public GET views.
+
+    The default backend is configured from ``RESPONSE_CACHE_SIZE`` and
+    ``RESPONSE_CACHE_TTL``. Namespaces are table names, see
+    :class:`GenerationalCache`.
+
+    Usage: ::
+
+        @response_cache.cached(api, 'users')
+        @marshal_with(user_fields)
+        def get(self, user_id):
+            ...
+    """
+
+    config_prefix = 'RESPONSE_CACHE'
+
+    def default_backend(self):
+        return TTLCache(self.config_prefix, maxsize=self.maxsize, ttl=self.ttl,
+                        sizeof=_response_size)
+
+    def key(self, namespace, view_args):
+        return '{0}:{1}:{2}:{3!r}:{4!r}:{5}'.format(
+            namespace,
+            self.generation(namespace),
+            request.endpoint,
+            sorted(view_args.items()),
+            sorted(request.args.items(multi=True)),
+            request.headers.get('Accept', ''),
+        )
+
+    def cached(self, api, namespace):
+        """Decorate a GET view so that its successful responses are served
+        from the cache. ``api`` turns the view's data into a response.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapped(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+
+                key = self.key(namespace, kwargs)
+                entry = self.backend.get(key)
+                if entry is None:
+                    self.misses += 1
+                    response = func(*args, **kwargs)
+                    if isinstance(response, BaseResponse):
+                        return response
+                    response = api.make_response(*unpack(response))
+                    if response.status_code == 200:
+                        headers = [(k, v) for k, v in response.headers
+                                   if k not in ('Content-Length',
+                                                'Set-Cookie')]
+                        # Compressed copies of the body, by encoding
+                        response.precompressed = {}
+                        self.backend.set(key, (response.get_data(), headers,
+                                               response.precompressed))
+                    return response
+
+                self.hits += 1
+                body, headers, precompressed = entry
+                response = current_app.response_class(body, 200, headers)
+                response.precompressed = precompressed
+                return response.make_conditional(request)
+            return wrapped
+        return decorator
+
+
+class CountCache(GenerationalCache):
+    """Caches ``COUNT`` results of queries, per statement and parameters.
+
+    The default backend is configured from ``COUNT_CACHE_SIZE`` and
+    ``COUNT_CACHE_TTL``. A write to any table the query reads from
+    invalidates its count.
+    """
+
+    config_prefix = 'COUNT_CACHE'
+    maxsize = 1024
+
+    def count(self, query):
+        """Return ``query.count()``, from the cache when possible."""
+        if not self.enabled:
+            return query.count()
+        statement = query.statement
+        compiled = statement.compile()
+        tables = sorted(set(table.name for table in find_tables(statement)))
+        key = 'count:{0}:{1}:{2!r}'.format(
+            ','.join(self.generation(table) for table in tables),
+            compiled, sorted(compiled.params.items()))
+
+        count = self.backend.get(key)
+        if count is None:
+            self.misses += 1
+            count = query.count()
+            self.backend.set(key, count)
+        else:
+            self.hits += 1
+        return count
+
+
+def _response_size(value):
+    # Generation tokens are stored alongside (body, headers, precompressed)
+    # entries. Only the uncompressed body is counted.
+    return len(value[0]) if isinstance(value, tuple) else 0
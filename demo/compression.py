@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Response compression.
+
+Compresses response bodies with brotli (when the ``brotli`` package is
+installed) or gzip, whichever the client prefers in ``Accept-Encoding``.
+Bodies under ``COMPRESS_MIN_SIZE`` bytes are sent as they are, since the
+few bytes saved are not worth the CPU. Streamed responses are compressed
+chunk by chunk as they are sent.
+
+Compressed responses get a weak ``ETag``, as their bytes differ from the
+uncompressed representation; conditional requests compare entity tags
+weakly so they still get 304s.
+"""
+
+import gzip
+import io
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Server preference when the client accepts several encodings equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level):
+    """Return ``data`` compressed with ``encoding`` at ``level``."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    buffer = io.BytesIO()
+    # mtime=0 keeps the output, and so cached copies, deterministic
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=level,
+                       mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def compress_chunks(chunks, encoding, level):
+    """Compress an iterable of byte strings incrementally."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=level)
+        process, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    try:
+        for chunk in chunks:
+            if not isinstance(chunk, bytes):
+                chunk = chunk.encode('utf-8')
+            data = process(chunk)
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class Compression(object):
+    """Compresses responses negotiated by ``Accept-Encoding``.
+
+    Config:
+
+    * ``COMPRESS_ENABLED``
+    * ``COMPRESS_MIN_SIZE``: smallest body in bytes worth compressing
+    * ``COMPRESS_LEVEL``: gzip level, 1 (fastest) to 9 (smallest)
+    * ``COMPRESS_BROTLI_LEVEL``: brotli quality, 0 (fastest) to 11
+    * ``COMPRESS_MIMETYPES``: media types to compress
+
+    A response carrying a ``precompressed`` dict (see
+    :class:`demo.cache.ResponseCache`) reuses the bodies compressed for it
+    earlier, keyed by encoding, and stores new ones in it.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_LEVEL', 4)
+        app.config.setdefault('COMPRESS_MIMETYPES', [
+            'application/json',
+            'application/x-ndjson',
+            'application/msgpack',
+            'application/x-msgpack',
+            'text/plain',
+            'text/html',
+        ])
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        config = current_app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+        if (response.mimetype not in config['COMPRESS_MIMETYPES'] or
+                not 200 <= response.status_code < 300 or
+                response.status_code == 204 or
+                response.direct_passthrough or
+                'Content-Encoding' in response.headers):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+        level = config['COMPRESS_BROTLI_LEVEL' if encoding == 'br'
+                       else 'COMPRESS_LEVEL']
+
+        if response.is_streamed:
+            response.response = compress_chunks(response.response, encoding,
+                                                level)
+            response.headers.pop('Content-Length', None)
+        else:
+            precompressed = getattr(response, 'precompressed', None)
+            if precompressed is not None and encoding in precompressed:
+                data = precompressed[encoding]
+            else:
+                data = response.get_data()
+                if len(data) < config['COMPRESS_MIN_SIZE']:
+                    return response
+                data = compress(data, encoding, level)
+                if precompressed is not None:
+                    precompressed[encoding] = data
+            response.set_data(data)
+
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag is not None and not weak:
+            response.set_etag(etag, weak=True)
+        return response
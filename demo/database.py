@@ -2,15 +2,167 @@
 """Database module, including the SQLAlchemy database object and DB-related
 utilities.
 """
-from sqlalchemy.orm import relationship
+import itertools
+
+from flask import abort, current_app, g, has_request_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.ext.declarative import declared_attr
+from sqlalchemy.orm import relationship, make_transient_to_detached
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm.attributes import set_committed_value
 
 from .extensions import db
 from .compat import basestring
+from .signals import model_changed
 
 # Alias common SQLAlchemy names
 relationship = relationship
 
 
+def make_etag(id, version):
+    return '{0}.{1}'.format(id, version)
+
+
+def commit_session():
+    """Commit the session.
+
+    Inside a request with ``DB_UNIT_OF_WORK`` enabled this only flushes, so
+    that generated keys are available, and the request's single commit is
+    left to :class:`UnitOfWork`.
+
+    A request that changed a record another transaction changed since it
+    was loaded is answered with 409 Conflict.
+    """
+    try:
+        if (has_request_context() and
+                current_app.config.get('DB_UNIT_OF_WORK')):
+            db.session.flush()
+            g.db_pending = True
+        else:
+            db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        if not has_request_context():
+            raise
+        g.pop('db_pending', None)
+        abort(409)
+
+
+class UnitOfWork(object):
+    """Commits the work flushed by :func:`commit_session` once at the end of
+    each request, or rolls it back if the request failed.
+
+    A failed commit is rolled back and re-raised, so the client gets a 500
+    rather than the response of a write that did not happen.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DB_UNIT_OF_WORK', False)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+
+    def after_request(self, response):
+        if g.pop('db_pending', False):
+            if response.status_code < 400:
+                try:
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            else:
+                db.session.rollback()
+        return response
+
+    def teardown_request(self, exc):
+        # after_request is skipped when the view raised
+        if g.pop('db_pending', False):
+            db.session.rollback()
+
+
+unit_of_work = UnitOfWork()
+
+
+def request_lookups():
+    """Return the records looked up by a unique attribute during the current
+    request, keyed by ``(class, attribute, value)``, or None outside one.
+    """
+    if has_request_context():
+        if 'lookups' not in g:
+            g.lookups = {}
+        return g.lookups
+
+
+def changed_models(session=None):
+    """Return the set of models changed in the session's transaction.
+
+    Flushed changes are recorded by a listener; statements that bypass the
+    unit of work, like the bulk helpers of :class:`CRUDMixin`, add their
+    model themselves. :data:`~demo.signals.model_changed` is sent for each
+    once the transaction commits, so that caches are never invalidated
+    before other connections can see the change.
+    """
+    if session is None:
+        session = db.session()
+    return session.info.setdefault('changed_models', set())
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_flushed_changes(session, flush_context):
+    changed = changed_models(session)
+    for instance in itertools.chain(session.new, session.deleted):
+        changed.add(type(instance))
+    for instance in session.dirty:
+        if session.is_modified(instance, include_collections=False):
+            changed.add(type(instance))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _send_model_changed(session):
+    for model in session.info.pop('changed_models', ()):
+        model_changed.send(model)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changes(session):
+    session.info.pop('changed_models', None)
+
+
+# Rows per multi-row INSERT, well under PostgreSQL's limit of 65535 bound
+# parameters per statement
+INSERT_CHUNK_SIZE = 1000
+
+
+def _same_keys(table, mappings):
+    """Give every mapping the keys any of them has, as a multi-row insert or
+    an executemany needs. Missing values take the column's scalar default.
+    """
+    keys = set()
+    for mapping in mappings:
+        keys.update(mapping)
+    defaults = {}
+    for key in keys:
+        default = table.c[key].default
+        defaults[key] = default.arg if default is not None and \
+            default.is_scalar else None
+    return [dict(defaults, **mapping) for mapping in mappings]
+
+
+def dispose_engines(app):
+    """Close every pooled connection of the app's engines.
+
+    Connections must not be shared between processes, so a worker forked
+    from a master that already used the database calls this first.
+    """
+    with app.app_context():
+        binds = [None] + list(app.config.get('SQLALCHEMY_BINDS') or ())
+        for bind in binds:
+            db.get_engine(app, bind=bind).dispose()
+
+
 class CRUDMixin(object):
     """Mixin that adds convenience methods for CRUD (create, read, update, delete)
     operations.
@@ -26,29 +178,137 @@ class CRUDMixin(object):
         """Update specific fields of a record."""
         # Prevent changing ID of object
         kwargs.pop('id', None)
-        for attr, value in kwargs.iteritems():
+        for attr, value in kwargs.items():
             # Flask-RESTful makes everything None by default :/
             if value is not None:
                 setattr(self, attr, value)
-        return commit and self.save() or self
+        return self.save(commit=commit)
 
     def save(self, commit=True):
-        """Save the record."""
+        """Save the record. Its version is bumped when the change is
+        flushed, see :class:`Model`.
+        """
         db.session.add(self)
         if commit:
-            db.session.commit()
+            commit_session()
         return self
 
     def delete(self, commit=True):
         """Remove the record from the database."""
         db.session.delete(self)
-        return commit and db.session.commit()
+        return commit and commit_session()
+
+    @classmethod
+    def bulk_create(cls, mappings, commit=True):
+        """Insert records from a list of dicts without building instances or
+        running a unit of work flush. Generated primary keys are written back
+        into the dicts.
+
+        PostgreSQL inserts up to :data:`INSERT_CHUNK_SIZE` rows per
+        ``INSERT ... VALUES ... RETURNING`` statement. SQLite inserts them
+        with one executemany and reads the keys back while the transaction
+        holds the write lock. Other databases insert a row at a time to
+        fetch each key.
+        """
+        table = cls.__table__
+        pk = inspect(cls).primary_key[0]
+        statement = table.insert()
+        dialect = db.session.get_bind(clause=statement).dialect.name
+        if not mappings:
+            pass
+        elif dialect == 'postgresql':
+            rows = _same_keys(table, mappings)
+            for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                chunk = rows[start:start + INSERT_CHUNK_SIZE]
+                ids = db.session.execute(
+                    statement.values(chunk).returning(pk)).fetchall()
+                for mapping, (id,) in zip(
+                        mappings[start:start + INSERT_CHUNK_SIZE], ids):
+                    mapping[pk.key] = id
+        elif dialect == 'sqlite' and \
+                not any(pk.key in mapping for mapping in mappings):
+            db.session.execute(statement, _same_keys(table, mappings))
+            # New rowids are consecutive after the largest one, and no other
+            # connection can insert until this transaction ends
+            last = db.session.execute(select([func.max(pk)])).scalar()
+            for id, mapping in enumerate(mappings, last - len(mappings) + 1):
+                mapping[pk.key] = id
+        else:
+            db.session.bulk_insert_mappings(cls, mappings,
+                                            return_defaults=True)
+        changed_models().add(cls)
+        return commit and commit_session()
+
+    @classmethod
+    def bulk_update(cls, mappings, commit=True):
+        """Update records from a list of dicts, each including the primary
+        key and the version it was read at. Each UPDATE checks and
+        increments the version, raising
+        :class:`~sqlalchemy.orm.exc.StaleDataError` if a record changed.
+        """
+        db.session.bulk_update_mappings(cls, mappings)
+        changed_models().add(cls)
+        return commit and commit_session()
+
+    @classmethod
+    def bulk_delete(cls, ids, commit=True):
+        """Delete the records with the given primary keys in one statement."""
+        pk = inspect(cls).primary_key[0]
+        cls.query.filter(pk.in_(ids)).delete(synchronize_session=False)
+        changed_models().add(cls)
+        return commit and commit_session()
+
+    def snapshot(self):
+        """Return the record's column values as a plain dict. Deferred
+        columns are left out, a rebuilt record loads them when accessed.
+        """
+        return dict((attr.key, getattr(self, attr.key))
+                    for attr in inspect(self).mapper.column_attrs
+                    if not attr.deferred)
+
+    @classmethod
+    def from_snapshot(cls, state):
+        """Attach a record rebuilt from :meth:`snapshot` to the session
+        without querying the database.
+        """
+        instance = cls.__mapper__.class_manager.new_instance()
+        for key, value in state.items():
+            set_committed_value(instance, key, value)
+        make_transient_to_detached(instance)
+        return db.session.merge(instance, load=False)
 
 
 class Model(CRUDMixin, db.Model):
-    """Base model class that includes CRUD convenience methods."""
+    """Base model class that includes CRUD convenience methods.
+
+    ``version`` is the mapper's version counter: every flushed change runs
+    ``UPDATE ... WHERE version = <loaded version>`` and increments it, and
+    raises :class:`~sqlalchemy.orm.exc.StaleDataError` if another
+    transaction changed the row first.
+    """
     __abstract__ = True
 
+    version = db.Column(db.Integer, nullable=False, default=1,
+                        server_default='1')
+
+    @declared_attr
+    def __mapper_args__(cls):
+        return {'version_id_col': cls.version}
+
+    @property
+    def etag(self):
+        """Strong entity tag for the current version of the record."""
+        return make_etag(self.id, self.version)
+
+    @classmethod
+    def etag_for(cls, **filters):
+        """Return the entity tag of the record matching ``filters`` by
+        loading only its id and version, or None if there is no such record.
+        """
+        row = db.session.query(cls.id, cls.version) \
+            .filter_by(**filters).first()
+        return row and make_etag(*row)
+
 
 # From Mike Bayer's "Building the app" talk
 # https://speakerdeck.com/zzzeek/building-the-app
@@ -60,20 +320,60 @@ class SurrogatePK(object):
 
     id = db.Column(db.Integer, primary_key=True)
 
+    # Unique attributes get_by() remembers records by during a request
+    lookup_keys = ('id',)
+
     @classmethod
-    def get_by_id(cls, id):
+    def get_by_id(cls, id, options=()):
         if id <= 0:
             raise ValueError('ID must not be negative or zero!')
         if any(
             (isinstance(id, basestring) and id.isdigit(),
              isinstance(id, (int, float))),
         ):
-            return cls.query.get(int(id))
+            return cls.get_by('id', int(id), options)
         return None
 
+    @classmethod
+    def get_by(cls, attr, value, options=()):
+        """Return the record whose unique ``attr`` equals ``value``, or None.
+
+        A record already looked up during the current request, by any of
+        its ``lookup_keys``, is returned without querying again.
+        """
+        lookups = request_lookups()
+        if lookups is not None:
+            instance = lookups.get((cls, attr, value))
+            if (instance is not None and inspect(instance).persistent and
+                    getattr(instance, attr) == value):
+                return instance
+
+        query = cls.query.options(*options) if options else cls.query
+        if attr == 'id':
+            instance = query.get(value)
+        else:
+            instance = query.filter_by(**{attr: value}).first()
+        if instance is not None:
+            instance.remember()
+        return instance
+
+    def remember(self):
+        """Let :meth:`get_by` find this record by its lookup keys for the
+        rest of the request.
+        """
+        lookups = request_lookups()
+        if lookups is not None:
+            unloaded = inspect(self).unloaded
+            for attr in self.lookup_keys:
+                if attr not in unloaded:
+                    lookups[(type(self), attr, getattr(self, attr))] = self
+
 
-def ReferenceCol(tablename, nullable=False, pk_name='id', **kwargs):
-    """Column that adds primary key foreign key reference.
+def ReferenceCol(tablename, nullable=False, pk_name='id', index=True,
+                 **kwargs):
+    """Column that adds primary key foreign key reference. The column is
+    indexed unless ``index=False`` is passed, e.g. because a composite index
+    already starts with it.
 
     Usage: ::
 
@@ -82,4 +382,4 @@ def ReferenceCol(tablename, nullable=False, pk_name='id', **kwargs):
     """
     return db.Column(
         db.ForeignKey("{0}.{1}".format(tablename, pk_name)),
-        nullable=nullable, **kwargs)  # pragma: no cover
+        nullable=nullable, index=index, **kwargs)  # pragma: no cover
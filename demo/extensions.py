@@ -4,14 +4,36 @@ in __init__.py
 """
 
 
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+from .routing import RoutingSQLAlchemy
+db = RoutingSQLAlchemy()
 
 from flask_migrate import Migrate
 migrate = Migrate()
 
-from flask_httpauth import HTTPBasicAuth
-auth = HTTPBasicAuth()
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
+basic_auth = HTTPBasicAuth()
+token_auth = HTTPTokenAuth(scheme='Bearer')
+# Resources accept either, picked by the Authorization header's scheme
+auth = MultiAuth(basic_auth, token_auth)
 
-from opbeat.contrib.flask import Opbeat
+from .cache import TTLCache, ResponseCache, CountCache
+# Successful Basic auth verifications, keyed by username
+credential_cache = TTLCache('AUTH_CACHE')
+# Users behind verified bearer tokens, keyed by id
+token_cache = TTLCache('AUTH_CACHE')
+# Serialized responses of public read endpoints
+response_cache = ResponseCache()
+# Total counts of paginated queries
+count_cache = CountCache()
+
+from .monitoring import Opbeat
 opbeat = Opbeat()
+
+from .instrumentation import Instrumentation
+instrumentation = Instrumentation()
+
+from .metrics import Metrics
+metrics = Metrics({'credential': credential_cache, 'token': token_cache})
+
+from .compression import Compression
+compression = Compression()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Cooperative mode for gevent workers.
+
+gunicorn's gevent workers monkey patch the standard library, but psycopg2
+talks to PostgreSQL through libpq in C, so every query blocks the whole
+worker. :func:`make_psycopg2_green` installs a wait callback that makes
+psycopg2 poll its socket through the gevent hub instead, letting other
+requests run while one waits for the database.
+
+``gunicorn.conf.py`` applies both when ``GUNICORN_WORKER_CLASS=gevent``;
+monkey patching has to happen before the app is imported.
+"""
+
+
+def gevent_wait_callback(conn, timeout=None):
+    """psycopg2 wait callback that yields to the gevent hub while waiting
+    for the connection's socket.
+    """
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(conn.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(conn.fileno(), timeout=timeout)
+        else:
+            raise OperationalError('Bad result from poll: %r' % state)
+
+
+def make_psycopg2_green():
+    """Make psycopg2 cooperative, if it is installed. Returns True if so."""
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        return False
+    extensions.set_wait_callback(gevent_wait_callback)
+    return True
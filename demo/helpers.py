@@ -1,46 +1,319 @@
 #!/usr/bin/env python
 
+import base64
+import binascii
 import functools
-from flask import request, url_for
+import hashlib
+import json
+from flask import request, url_for, abort, current_app
+from flask_restful.utils import unpack
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+from werkzeug.http import quote_etag
 
+from .compat import string_types, text_type
+from .extensions import count_cache
+from .marshalling import requested_fields
+from .representations import representation_etag
 
-def paginate(max_per_page=100):
+# Query string arguments owned by the paginate decorator
+PAGINATION_ARGS = ('page', 'per_page', 'after', 'before', 'count')
+
+
+def encode_cursor(id):
+    """Return an opaque pagination token for the row with the given id."""
+    token = base64.urlsafe_b64encode(text_type(id).encode('ascii'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the row id encoded in a pagination token, or None for an empty
+    token. Aborts with 400 if the token is malformed.
+    """
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (TypeError, ValueError, UnicodeError, binascii.Error):
+        abort(400)
+
+
+def _flag(name, default=True):
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() not in ('0', 'false', 'no', 'off')
+
+
+def _link(view_args, **params):
+    # Keep any filters the client sent, replacing the pagination arguments
+    args = dict((k, v) for k, v in request.args.items()
+                if k not in PAGINATION_ARGS)
+    args.update(view_args)
+    args.update(params)
+    if not _flag('count'):
+        args['count'] = 'false'
+    return url_for(request.endpoint, **args)
+
+
+def estimate_count(query):
+    """Return the PostgreSQL planner's estimate of the number of rows of
+    ``query``, or None on other databases.
+    """
+    statement = query.statement
+    connection = query.session.connection(clause=statement)
+    if connection.dialect.name != 'postgresql':
+        return None
+    compiled = statement.compile(dialect=connection.dialect)
+    plan = connection.execute('EXPLAIN (FORMAT JSON) ' + text_type(compiled),
+                              compiled.params).scalar()
+    if isinstance(plan, string_types):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def count_total(query, strategy='exact', counter=None):
+    """Count the rows of ``query`` for pagination metadata.
+
+    Returns ``(total, estimated)``. Strategies:
+
+    * ``exact``: ``SELECT count(*)`` over the filtered query
+    * ``cached``: an exact count, kept in :data:`count_cache` until a write
+      to one of the query's tables or ``COUNT_CACHE_TTL``
+    * ``counter``: ``counter()``, a denormalized count supplied by the view,
+      or exact when there is none or it returns None
+    * ``estimate``: the planner's estimate on PostgreSQL, exact when it is
+      below ``COUNT_ESTIMATE_MIN`` or on other databases
+    """
+    query = query.order_by(None)
+    if strategy == 'cached':
+        return count_cache.count(query), False
+    if strategy == 'counter' and counter is not None:
+        total = counter()
+        if total is not None:
+            return total, False
+    elif strategy == 'estimate':
+        total = estimate_count(query)
+        if total is not None and \
+                total >= current_app.config.get('COUNT_ESTIMATE_MIN', 1000):
+            return total, True
+    elif strategy not in ('exact', 'counter'):
+        raise ValueError('Unknown count strategy {0!r}'.format(strategy))
+    return query.count(), False
+
+
+def _offset_page(query, view_args, page, per_page, count):
+    if page < 1:
+        abort(404)
+
+    # Fetch one extra row to find out if there is a next page
+    items = query.limit(per_page + 1).offset((page - 1) * per_page).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+    has_prev = page > 1
+    if not items and page != 1:
+        abort(404)
+
+    total, estimated = count() if count else (None, False)
+    pages = None if total is None else -(-total // per_page)
+
+    links = {}
+    if has_next:
+        links['next'] = _link(view_args, page=page + 1, per_page=per_page)
+    if has_prev:
+        links['prev'] = _link(view_args, page=page - 1, per_page=per_page)
+    links['first'] = _link(view_args, page=1, per_page=per_page)
+    if pages is not None:
+        links['last'] = _link(view_args, page=pages, per_page=per_page)
+
+    meta = {
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'pages': pages,
+        'estimated': estimated,
+        'links': links,
+    }
+    return items, meta
+
+
+def _keyset_page(query, view_args, per_page, count):
+    model = query.column_descriptions[0]['entity']
+    after = decode_cursor(request.args.get('after'))
+    before = decode_cursor(request.args.get('before'))
+    backwards = 'before' in request.args and 'after' not in request.args
+
+    total, estimated = count() if count else (None, False)
+
+    page_query = query.order_by(None)
+    if after is not None:
+        page_query = page_query.filter(model.id > after)
+    if before is not None:
+        page_query = page_query.filter(model.id < before)
+    if backwards:
+        page_query = page_query.order_by(model.id.desc())
+    else:
+        page_query = page_query.order_by(model.id)
+
+    # Fetch one extra row to find out if there is another page
+    items = page_query.limit(per_page + 1).all()
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+
+    links = {}
+    if items:
+        first, last = items[0].id, items[-1].id
+        more_after = has_more if not backwards else before is not None
+        more_before = has_more if backwards else after is not None
+        if more_after:
+            links['next'] = _link(view_args, after=encode_cursor(last),
+                                  per_page=per_page)
+        if more_before:
+            links['prev'] = _link(view_args, before=encode_cursor(first),
+                                  per_page=per_page)
+    links['first'] = _link(view_args, after='', per_page=per_page)
+    links['last'] = _link(view_args, before='', per_page=per_page)
+
+    meta = {
+        'page': None,
+        'per_page': per_page,
+        'total': total,
+        'pages': None if total is None else -(-total // per_page),
+        'estimated': estimated,
+        'links': links,
+    }
+    return items, meta
+
+
+def load_fields(model, fields):
+    """Return query options loading only the columns of ``model`` needed for
+    the fields selected with ``?fields=`` (see :class:`marshal_with`), plus
+    its primary key and version. Without a selection there are none.
+    """
+    selected = requested_fields(fields)
+    if selected is None:
+        return ()
+    columns = set(attr.key for attr in inspect(model).column_attrs)
+    keys = set(getattr(fields[name], 'attribute', None) or name
+               for name in selected)
+    keys.add('version')
+    return (load_only(*sorted(keys & columns)),)
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has ``etag`` (as made
+    by :func:`~demo.representations.representation_etag`), else None.
+    """
+    # Weak comparison: compressed responses carry weak entity tags
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.vary.add('Accept')
+        return response
+
+
+def conditional(etag_for):
+    """Answer conditional GETs for the record returned by the decorated view.
+
+    ``etag_for`` is called with the view's keyword arguments when the client
+    sends ``If-None-Match`` and should return the current entity tag of the
+    record (see :meth:`demo.database.Model.etag_for`). If it matches, a 304
+    is returned without calling the view. Otherwise the returned record's
+    ``ETag`` header is set. Entity tags are those of the negotiated
+    representation. Place it below ``marshal_with``.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if request.if_none_match:
+                response = not_modified(
+                    representation_etag(etag_for(**kwargs)))
+                if response is not None:
+                    return response
+
+            data, code, headers = unpack(func(*args, **kwargs))
+            etag = representation_etag(getattr(data, 'etag', None))
+            if code == 200 and etag is not None:
+                headers = dict(headers or {}, ETag=quote_etag(etag))
+            return data, code, headers
+        return wrapped
+    return decorator
+
+
+def page_etag(items, meta):
+    """Entity tag for a page, covering the id and version of every row as
+    well as the pagination metadata.
+    """
+    digest = hashlib.sha1(json.dumps(meta, sort_keys=True).encode('utf-8'))
+    for item in items:
+        digest.update('{0}.{1};'.format(item.id, item.version)
+                      .encode('ascii'))
+    return digest.hexdigest()
+
+
+def paginate(max_per_page=100, count=None):
+    """Paginate the query returned by the decorated view.
+
+    Two modes are supported:
+
+    * offset (default): ``?page=N&per_page=M``
+    * keyset: ``?after=<token>`` or ``?before=<token>``, where tokens come
+      from the ``next``/``prev`` links. An empty ``after`` starts at the
+      first row and an empty ``before`` at the last. Rows are ordered by
+      ``id`` and deep pages cost the same as the first one.
+
+    ``?count=false`` skips the total count; ``total`` and ``pages`` are then
+    null and there is no ``last`` link in offset mode.
+
+    ``count`` names the strategy used to count the total, see
+    :func:`count_total`; it defaults to the ``PAGINATE_COUNT`` setting.
+    ``meta.estimated`` is true when the total is a planner estimate. The
+    view may return ``(query, counter)`` to supply the ``counter`` strategy
+    with a function returning a denormalized total.
+
+    Pages carry an ``ETag`` and are answered with 304 when it matches
+    ``If-None-Match``, skipping marshalling.
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapped(*args, **kwargs):
-            page = request.args.get('page', 1, type=int)
             per_page = min(request.args.get('per_page', max_per_page,
                                             type=int),
                            max_per_page)
+            if per_page < 1:
+                abort(400)
 
-            query = func(*args, **kwargs)
-            p = query.paginate(page, per_page)
+            query, counter = func(*args, **kwargs), None
+            if isinstance(query, tuple):
+                query, counter = query
 
-            meta = {
-                'page': page,
-                'per_page': per_page,
-                'total': p.total,
-                'pages': p.pages,
-            }
+            total = None
+            if _flag('count'):
+                strategy = count or current_app.config.get('PAGINATE_COUNT',
+                                                           'exact')
+                total = functools.partial(count_total, query, strategy,
+                                          counter)
+
+            if 'after' in request.args or 'before' in request.args:
+                items, meta = _keyset_page(query, kwargs, per_page, total)
+            else:
+                page = request.args.get('page', 1, type=int)
+                items, meta = _offset_page(query, kwargs, page, per_page,
+                                           total)
+
+            etag = representation_etag(page_etag(items, meta))
+            response = not_modified(etag)
+            if response is not None:
+                return response
 
-            links = {}
-            if p.has_next:
-                links['next'] = url_for(request.endpoint, page=p.next_num,
-                                        per_page=per_page, **kwargs)
-            if p.has_prev:
-                links['prev'] = url_for(request.endpoint, page=p.prev_num,
-                                        per_page=per_page, **kwargs)
-            links['first'] = url_for(request.endpoint, page=1,
-                                     per_page=per_page, **kwargs)
-            links['last'] = url_for(request.endpoint, page=p.pages,
-                                    per_page=per_page, **kwargs)
-
-            meta['links'] = links
             result = {
-                'items': p.items,
+                'items': items,
                 'meta': meta
             }
 
-            return result, 200
+            return result, 200, {'ETag': quote_etag(etag)}
         return wrapped
     return decorator
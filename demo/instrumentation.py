@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Per-request SQL instrumentation.
+
+Counts and times every statement executed while a request is handled, then
+reports the totals in a ``Server-Timing`` header and in the fields of a log
+record. Views can declare a query budget with :func:`query_budget` to catch
+N+1 query patterns.
+"""
+
+import functools
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('demo.requests')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a request runs more queries than its declared budget and
+    ``QUERY_BUDGET_ENFORCE`` is on (the default when testing).
+    """
+
+
+class RequestStats(object):
+    """SQL statistics for one request."""
+
+    def __init__(self, keep_slowest=3):
+        self.started = time.time()
+        self.queries = 0
+        self.db_time = 0.0
+        self.keep_slowest = keep_slowest
+        self.slowest = []
+        self.statements = Counter()
+
+    def record(self, statement, elapsed):
+        self.queries += 1
+        self.db_time += elapsed
+        self.statements[statement] += 1
+        self.slowest.append((elapsed, statement))
+        self.slowest.sort(key=lambda item: item[0], reverse=True)
+        del self.slowest[self.keep_slowest:]
+
+    def repeated(self, threshold):
+        """Statements run at least ``threshold`` times, a hint of N+1."""
+        return dict((statement, count)
+                    for statement, count in self.statements.items()
+                    if count >= threshold)
+
+
+def current_stats():
+    """Return the stats of the current request, or None outside one."""
+    if has_app_context():
+        return g.get('query_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start_time', []).append(time.time())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.time() - conn.info['query_start_time'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.record(statement, elapsed)
+
+
+class Instrumentation(object):
+    """Collects :class:`RequestStats` for every request.
+
+    Config:
+
+    * ``SERVER_TIMING``: add a ``Server-Timing`` header to responses
+    * ``SLOW_QUERY_MS``: log statements slower than this as warnings
+    * ``N_PLUS_ONE_THRESHOLD``: warn when one statement runs this many times
+    * ``QUERY_BUDGET_ENFORCE``: raise :class:`QueryBudgetExceeded` instead of
+      logging a warning when a view goes over its :func:`query_budget`
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SERVER_TIMING', True)
+        app.config.setdefault('SLOW_QUERY_MS', 100)
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('QUERY_BUDGET_ENFORCE', app.testing)
+        # Listen on every engine, including ones created after this point
+        if not event.contains(Engine, 'before_cursor_execute',
+                              _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+    def before_request(self):
+        g.query_stats = RequestStats()
+
+    def after_request(self, response):
+        stats = g.get('query_stats')
+        if stats is None:
+            return response
+        config = current_app.config
+        duration = time.time() - stats.started
+
+        if config['SERVER_TIMING']:
+            response.headers.add(
+                'Server-Timing',
+                'db;dur={0:.3f};desc="{1} queries", app;dur={2:.3f}'.format(
+                    stats.db_time * 1000, stats.queries, duration * 1000))
+
+        logger.info('%s %s %s', request.method, request.path,
+                    response.status_code, extra={
+                        'status': response.status_code,
+                        'duration_ms': round(duration * 1000, 3),
+                        'db_queries': stats.queries,
+                        'db_time_ms': round(stats.db_time * 1000, 3),
+                        'db_slowest': [(round(elapsed * 1000, 3), statement)
+                                       for elapsed, statement
+                                       in stats.slowest],
+                    })
+
+        for elapsed, statement in stats.slowest:
+            if elapsed * 1000 >= config['SLOW_QUERY_MS']:
+                logger.warning('Slow query (%.1f ms) in %s %s: %s',
+                               elapsed * 1000, request.method, request.path,
+                               statement)
+        repeated = stats.repeated(config['N_PLUS_ONE_THRESHOLD'])
+        for statement, count in repeated.items():
+            logger.warning('Possible N+1: statement ran %d times in %s %s: '
+                           '%s', count, request.method, request.path,
+                           statement)
+
+        budget = g.get('query_budget')
+        if budget is not None and stats.queries > budget:
+            message = '{0} {1} ran {2} queries, budget is {3}'.format(
+                request.method, request.path, stats.queries, budget)
+            if config['QUERY_BUDGET_ENFORCE']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def query_budget(max_queries):
+    """Declare the most SQL statements a request to the decorated view may
+    run, counting those of authentication and other request hooks too.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            g.query_budget = max_queries
+            return func(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+@contextmanager
+def count_queries():
+    """Count the statements run inside the block, outside of requests too.
+
+    Usage: ::
+
+        with count_queries() as stats:
+            client.get('/api/users')
+        assert stats.queries <= 2
+    """
+    stats = RequestStats()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        stats.record(statement, 0.0)
+
+    event.listen(Engine, 'after_cursor_execute', record)
+    try:
+        yield stats
+    finally:
+        event.remove(Engine, 'after_cursor_execute', record)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Precompiled marshalling.
+
+:func:`flask_restful.marshal` walks the fields dict and calls
+``Field.output`` (and its ``get_value`` helpers) for every field of every
+item. :func:`compile_fields` does that walk once, generating a plain Python
+function per fields dict that reads and formats each value inline. The
+output is identical to ``marshal``; field types without a specialized
+template fall back to their own ``output`` method.
+
+:class:`marshal_with` also implements sparse fieldsets: ``?fields=id,summary``
+restricts the output to the named fields.
+"""
+
+from collections import OrderedDict
+from functools import wraps
+
+from flask import abort, request
+from flask_restful import fields as restful_fields
+from flask_restful.utils import unpack
+from werkzeug.wrappers import Response as BaseResponse
+
+from .compat import string_types, text_type
+
+# Expression templates for the formatting done by the stock field types.
+# ``{v}`` is the raw value (already known not to be None).
+_FORMATS = {
+    restful_fields.Raw: '{v}',
+    restful_fields.String: '_text({v})',
+    restful_fields.Integer: 'int({v})',
+    restful_fields.Boolean: 'bool({v})',
+    restful_fields.Float: 'float({v})',
+}
+
+
+def _indexable(obj):
+    # Same test as flask_restful.fields.is_indexable_but_not_string
+    return not hasattr(obj, 'strip') and hasattr(obj, '__iter__')
+
+
+def _item(obj, key):
+    try:
+        return obj[key]
+    except (IndexError, TypeError, KeyError):
+        return getattr(obj, key, None)
+
+
+def _make(field):
+    if isinstance(field, type):
+        return field()
+    return field
+
+
+class _Compiler(object):
+
+    def __init__(self):
+        self.namespace = {
+            'OrderedDict': OrderedDict,
+            '_text': text_type,
+            '_indexable': _indexable,
+            '_item': _item,
+        }
+        self.sources = []
+
+    def constant(self, value):
+        name = '_c%d' % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def reserve(self):
+        """Claim a name for a function whose body is generated later."""
+        self.sources.append(None)
+        return len(self.sources) - 1, '_f%d' % (len(self.sources) - 1)
+
+    def define(self, index, name, lines):
+        self.sources[index] = 'def %s%s' % (name, '\n    '.join(lines))
+        return name
+
+    def function(self, lines):
+        index, name = self.reserve()
+        return self.define(index, name, lines)
+
+    def nested(self, field, value):
+        """Expression marshalling ``value`` with a ``fields.Nested``."""
+        serializer = self.serializer(field.nested)
+        if field.allow_null:
+            if_none = 'None'
+        elif field.default is not None:
+            if_none = self.constant(field.default)
+        else:
+            if_none = '%s(None)' % serializer
+        return '(%s if %s is None else %s(%s))' % (
+            if_none, value, serializer, value)
+
+    def list_of_nested(self, field):
+        """Function marshalling a ``fields.List(fields.Nested(...))``."""
+        item = self.nested(field.container, 'x')
+        return self.function([
+            '(value):',
+            'if _indexable(value) and not isinstance(value, dict):',
+            '    return [%s for x in value]' % item,
+            'if value is None:',
+            '    return %s' % self.constant(field.default),
+            'return [%s(value)]' % self.serializer(field.container.nested),
+        ])
+
+    def serializer(self, fields):
+        """Function equivalent to ``marshal(obj, fields)``."""
+        # Claim the name first so nested serializers get their own
+        index, name = self.reserve()
+        getters, items = [], []
+        for key, field in fields.items():
+            if isinstance(field, dict):
+                items.append('(%r, %s(obj))' % (key, self.serializer(field)))
+                continue
+
+            field = _make(field)
+            attribute = key if field.attribute is None else field.attribute
+            simple_key = (isinstance(attribute, string_types) and
+                          '.' not in attribute)
+            value = 'v%d' % len(getters)
+
+            if not simple_key:
+                expr = None
+            elif type(field) in _FORMATS:
+                expr = '(%s if %s is None else %s)' % (
+                    self.constant(field.default), value,
+                    _FORMATS[type(field)].format(v=value))
+            elif type(field) is restful_fields.Nested:
+                expr = self.nested(field, value)
+            elif (type(field) is restful_fields.List and
+                  type(field.container) is restful_fields.Nested):
+                expr = '%s(%s)' % (self.list_of_nested(field), value)
+            else:
+                expr = None
+
+            if expr is None:
+                # No template for this field, let it marshal itself
+                items.append('(%r, %s.output(%r, obj))' % (
+                    key, self.constant(field), key))
+            else:
+                getters.append((value, attribute))
+                items.append('(%r, %s)' % (key, expr))
+
+        lines = [
+            '(obj):',
+            'if isinstance(obj, (list, tuple)):',
+            '    return [%s(o) for o in obj]' % name,
+        ]
+        if getters:
+            lines.append('if _indexable(obj):')
+            lines.extend('    %s = _item(obj, %r)' % (value, attribute)
+                         for value, attribute in getters)
+            lines.append('else:')
+            lines.extend('    %s = getattr(obj, %r, None)' % (value, attribute)
+                         for value, attribute in getters)
+        lines.append('return OrderedDict([%s])' % ', '.join(items))
+        return self.define(index, name, lines)
+
+    def build(self, fields):
+        name = self.serializer(fields)
+        exec('\n\n'.join(self.sources), self.namespace)
+        return self.namespace[name]
+
+
+def compile_fields(fields):
+    """Return a function ``serialize(data)`` that gives the same result as
+    ``flask_restful.marshal(data, fields)``.
+    """
+    return _Compiler().build(fields)
+
+
+def requested_fields(fields):
+    """Return the names of ``fields`` selected by the ``?fields=`` argument
+    in declaration order, or None when there is no selection. Aborts with
+    400 when it names unknown fields.
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    names = set(name.strip() for name in value.split(',') if name.strip())
+    if not names or not names.issubset(fields):
+        abort(400)
+    return tuple(name for name in fields if name in names)
+
+
+class marshal_with(object):
+    """Drop-in replacement for :class:`flask_restful.marshal_with` that
+    compiles the fields once when the view is decorated.
+
+    With ``sparse=True`` the client may select a subset of ``fields`` with
+    ``?fields=``; for collections, ``sparse`` names the key of the
+    ``List(Nested(...))`` whose item fields can be selected. A serializer
+    is compiled for each distinct selection the first time it is seen.
+    """
+
+    def __init__(self, fields, envelope=None, sparse=None):
+        self.fields = fields
+        self.envelope = envelope
+        self.sparse = sparse
+        self.serialize = compile_fields(fields)
+        self.serializers = {None: self.serialize}
+
+    @property
+    def selectable(self):
+        """The fields ``?fields=`` selects from."""
+        if self.sparse is True:
+            return self.fields
+        return self.fields[self.sparse].container.nested
+
+    def serializer(self, selected):
+        serialize = self.serializers.get(selected)
+        if serialize is None:
+            fields = OrderedDict((name, self.selectable[name])
+                                 for name in selected)
+            if self.sparse is not True:
+                items = restful_fields.List(restful_fields.Nested(fields))
+                fields = dict(self.fields)
+                fields[self.sparse] = items
+            serialize = self.serializers[selected] = compile_fields(fields)
+        return serialize
+
+    def marshal(self, data, serialize=None):
+        serialize = serialize or self.serialize
+        if self.envelope:
+            return OrderedDict([(self.envelope, serialize(data))])
+        return serialize(data)
+
+    def __call__(self, f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            serialize = None
+            if self.sparse:
+                # Before calling the view, so bad selections cost nothing
+                serialize = self.serializer(
+                    requested_fields(self.selectable))
+            resp = f(*args, **kwargs)
+            if isinstance(resp, BaseResponse):
+                # e.g. 304 Not Modified, nothing to marshal
+                return resp
+            if isinstance(resp, tuple):
+                data, code, headers = unpack(resp)
+                return self.marshal(data, serialize), code, headers
+            else:
+                return self.marshal(resp, serialize)
+        return wrapper
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""Prometheus metrics.
+
+Exposes request counts, latency histograms, in-flight requests, database
+pool usage and wait times, and auth cache stats at ``/metrics``.
+
+Under gunicorn every worker is a separate process. When
+``PROMETHEUS_MULTIPROC_DIR`` is set (``gunicorn.conf.py`` does this) each
+worker writes its samples to mmap'd files in that directory and a scrape
+served by any worker aggregates all of them.
+"""
+
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import Pool, QueuePool
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests handled',
+    ['method', 'endpoint', 'status'])
+LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling HTTP requests',
+    ['method', 'endpoint'])
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'HTTP requests being handled',
+    multiprocess_mode='livesum')
+
+DB_CHECKED_OUT = Gauge(
+    'db_pool_checked_out', 'Database connections checked out of the pool',
+    multiprocess_mode='livesum')
+DB_CONNECTIONS = Counter(
+    'db_pool_connections_created_total', 'Database connections opened')
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pooled connection',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 10))
+
+AUTH_CACHE = Gauge(
+    'auth_cache', 'Auth cache counters of live workers', ['cache', 'stat'],
+    multiprocess_mode='livesum')
+
+
+class MeasuredQueuePool(QueuePool):
+    """A :class:`QueuePool` recording how long each checkout waited for a
+    free connection (or for a new one to be opened).
+    """
+
+    def _do_get(self):
+        started = time.time()
+        try:
+            return super(MeasuredQueuePool, self)._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.time() - started)
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_CHECKED_OUT.inc()
+
+
+def _checkin(dbapi_connection, connection_record):
+    DB_CHECKED_OUT.dec()
+
+
+def _connect(dbapi_connection, connection_record):
+    DB_CONNECTIONS.inc()
+
+
+class Metrics(object):
+    """Records request metrics and serves them at ``METRICS_PATH``.
+
+    ``auth_caches`` maps the ``cache`` label of the auth cache gauges to
+    the caches they report.
+    """
+
+    def __init__(self, auth_caches=None, app=None):
+        self.auth_caches = auth_caches or {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        if not event.contains(Pool, 'checkout', _checkout):
+            event.listen(Pool, 'checkout', _checkout)
+            event.listen(Pool, 'checkin', _checkin)
+            event.listen(Pool, 'connect', _connect)
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.view)
+
+    def before_request(self):
+        g.metrics_started = time.time()
+        IN_FLIGHT.inc()
+
+    def after_request(self, response):
+        started = g.get('metrics_started')
+        if started is not None:
+            endpoint = request.endpoint or 'unknown'
+            LATENCY.labels(request.method, endpoint) \
+                .observe(time.time() - started)
+            REQUESTS.labels(request.method, endpoint,
+                            response.status_code).inc()
+        for name, cache in self.auth_caches.items():
+            stats = cache.stats()
+            for stat in ('hits', 'misses', 'size'):
+                AUTH_CACHE.labels(name, stat).set(stats[stat])
+        return response
+
+    def teardown_request(self, exc):
+        if g.pop('metrics_started', None) is not None:
+            IN_FLIGHT.dec()
+
+    def view(self):
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), 200, \
+            {'Content-Type': CONTENT_TYPE_LATEST}
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of a worker that exited (gunicorn child_exit)."""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
@@ -10,8 +10,15 @@ from demo.database import (
 
 class Task(SurrogatePK, Model):
     __tablename__ = 'tasks'
-    # Define a foreign key relationship to a User object
-    user_id = ReferenceCol('users')
+    __table_args__ = (
+        # Matches the task collection: filter by user (and optionally
+        # completion), ordered by id
+        db.Index('ix_tasks_user_id_complete_id', 'user_id', 'complete', 'id'),
+        SurrogatePK.__table_args__,
+    )
+    # Define a foreign key relationship to a User object. No separate index,
+    # the composite index above leads with this column.
+    user_id = ReferenceCol('users', index=False)
     complete = db.Column(db.Boolean, default=False)
     summary = db.Column(db.String, nullable=True)
     description = db.Column(db.String, nullable=True)
@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 
+from sqlalchemy import event, false, func, inspect, select
+from sqlalchemy.orm import object_session
 from werkzeug.security import generate_password_hash, check_password_hash
 from demo.database import (
     db,
@@ -7,6 +9,7 @@ from demo.database import (
     SurrogatePK,
     relationship,
 )
+from demo.extensions import credential_cache, token_cache
 from .task import Task
 
 
@@ -15,15 +18,30 @@ class User(SurrogatePK, Model):
     username = db.Column(db.String, unique=True, nullable=False)
     email = db.Column(db.String, unique=True, nullable=False)
     password_hash = db.Column(db.String, nullable=False)
+    # Bumped with every new password, revoking the user's bearer tokens
+    password_version = db.Column(db.Integer, nullable=False, default=1,
+                                 server_default='1')
     first_name = db.Column(db.String, nullable=True)
     last_name = db.Column(db.String, nullable=True)
 
+    # Denormalized task counts for the 'counter' pagination strategy, kept
+    # up to date by the Task listeners below and by recount_tasks(). Only
+    # loaded when accessed.
+    task_count = db.deferred(
+        db.Column(db.Integer, nullable=False, default=0, server_default='0'),
+        group='task_counts')
+    open_task_count = db.deferred(
+        db.Column(db.Integer, nullable=False, default=0, server_default='0'),
+        group='task_counts')
+
     tasks = relationship(Task, backref=db.backref('user'))
 
+    lookup_keys = ('id', 'username')
+
     def __init__(self, username, email, password, **kwargs):
+        # The password property hashes it
         db.Model.__init__(self, username=username, email=email,
                           password=password, **kwargs)
-        self.set_password(password)
 
     @property
     def password(self):
@@ -34,18 +52,104 @@ class User(SurrogatePK, Model):
         self.set_password(password)
 
     def set_password(self, password):
+        credential_cache.invalidate(self.username)
+        token_cache.invalidate(self.id)
         self.password_hash = generate_password_hash(password)
+        self.password_version = (self.password_version or 0) + 1
 
     def check_password(self, value):
         return check_password_hash(self.password_hash, value)
 
+    def update(self, commit=True, **kwargs):
+        # Username may change, so drop the entry under the old one
+        credential_cache.invalidate(self.username)
+        token_cache.invalidate(self.id)
+        return super(User, self).update(commit=commit, **kwargs)
+
+    def delete(self, commit=True):
+        credential_cache.invalidate(self.username)
+        token_cache.invalidate(self.id)
+        return super(User, self).delete(commit=commit)
+
     @property
     def full_name(self):
         return '%s %s' % (self.first_name, self.last_name)
 
     @classmethod
-    def get_by_username(cls, username):
-        return cls.query.filter_by(username=username).first()
+    def get_by_username(cls, username, options=()):
+        return cls.get_by('username', username, options)
+
+    @classmethod
+    def recount_tasks(cls, user_id=None):
+        """Recompute the task counts of one user, or of every user, after
+        tasks were changed without the ORM (e.g. by ``Task.bulk_create``).
+        """
+        db.session.execute(_recount_tasks(user_id))
+        for user in db.session.identity_map.values():
+            if isinstance(user, cls) and user_id in (None, user.id):
+                db.session.expire(user, ['task_count', 'open_task_count'])
 
     def __repr__(self):  # pragma: nocover
         return '<User({username!r})>'.format(username=self.username)
+
+
+def _recount_tasks(user_id=None):
+    users, tasks = User.__table__, Task.__table__
+    owned = tasks.c.user_id == users.c.id
+    statement = users.update().values(
+        task_count=select([func.count()]).where(owned).as_scalar(),
+        open_task_count=select([func.count()]).where(
+            owned & (tasks.c.complete == false())).as_scalar(),
+    )
+    if user_id is not None:
+        statement = statement.where(users.c.id == user_id)
+    return statement
+
+
+def _is_open(complete):
+    # Matches the ?complete=0 filter, which excludes NULLs
+    return complete is not None and not complete
+
+
+def _expire_task_counts(task):
+    # Make an already loaded owner read its new counts
+    session = object_session(task)
+    user = session.identity_map.get(session.identity_key(User, task.user_id))
+    if user is not None:
+        session.expire(user, ['task_count', 'open_task_count'])
+
+
+def _adjust_task_counts(connection, task, tasks=0, open_tasks=0):
+    users = User.__table__
+    if tasks or open_tasks:
+        connection.execute(
+            users.update().where(users.c.id == task.user_id).values(
+                task_count=users.c.task_count + tasks,
+                open_task_count=users.c.open_task_count + open_tasks))
+        _expire_task_counts(task)
+
+
+@event.listens_for(Task, 'after_insert')
+def _task_inserted(mapper, connection, task):
+    _adjust_task_counts(connection, task, 1, _is_open(task.complete))
+
+
+@event.listens_for(Task, 'after_update')
+def _task_updated(mapper, connection, task):
+    history = inspect(task).attrs.complete.history
+    if not history.has_changes():
+        return
+    if not history.deleted:
+        # The old value was never loaded
+        connection.execute(_recount_tasks(task.user_id))
+        _expire_task_counts(task)
+    else:
+        _adjust_task_counts(connection, task, 0,
+                            _is_open(task.complete) -
+                            _is_open(history.deleted[0]))
+
+
+@event.listens_for(Task, 'after_delete')
+def _task_deleted(mapper, connection, task):
+    _adjust_task_counts(connection, task, -1,
+                        -_is_open(task.complete))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""Error and performance reporting to Opbeat."""
+
+
+class Opbeat(object):
+    """Instruments the app with the Opbeat client when ``OPBEAT['APP_ID']``
+    is configured.
+
+    The client is slow to import and pulls in many modules, so it is only
+    imported by :meth:`init_app`, and only when it will be used.
+    """
+
+    def __init__(self, app=None):
+        self.client = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('OPBEAT', {}).get('APP_ID'):
+            return
+        from opbeat.contrib.flask import Opbeat
+        self.client = Opbeat()
+        self.client.init_app(app)
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""Response representations for the API.
+
+JSON is encoded by the backend named in ``JSON_BACKEND``; ``auto`` picks the
+fastest one installed, trying orjson, then ujson, then the standard
+library. Output is compact unless ``JSON_PRETTY`` is set (the development
+config sets it).
+
+When msgpack is installed, clients that prefer ``application/msgpack``
+(or ``application/x-msgpack``) in their ``Accept`` header get MessagePack.
+Responses carry ``Vary: Accept``, and the entity tags of other
+representations than JSON have it mixed in (see
+:func:`representation_etag`), so that neither shared caches nor
+conditional requests mix up the encodings.
+"""
+
+import json
+from collections import OrderedDict
+
+from flask import current_app, make_response, request
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+
+DEFAULT_MIMETYPE = 'application/json'
+
+# Appended to the entity tags of representations other than JSON
+ETAG_SUFFIXES = dict.fromkeys(MSGPACK_MIMETYPES, 'msgpack')
+
+# Representations registered on the API, by media type
+REPRESENTATIONS = OrderedDict()
+
+
+def _orjson_dumps(data):
+    return orjson.dumps(data)
+
+
+def _ujson_dumps(data):
+    return ujson.dumps(data, ensure_ascii=False,
+                       escape_forward_slashes=False).encode('utf-8')
+
+
+def _json_dumps(data):
+    return json.dumps(data, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+# Compact encoders returning UTF-8 bytes, fastest first
+JSON_BACKENDS = OrderedDict((name, dumps) for name, module, dumps in (
+    ('orjson', orjson, _orjson_dumps),
+    ('ujson', ujson, _ujson_dumps),
+    ('json', json, _json_dumps),
+) if module is not None)
+
+
+def dumps(data):
+    """Encode ``data`` as compact JSON bytes with the configured backend."""
+    name = current_app.config.get('JSON_BACKEND', 'auto')
+    if name == 'auto':
+        name = next(iter(JSON_BACKENDS))
+    try:
+        return JSON_BACKENDS[name](data)
+    except KeyError:
+        raise ValueError('JSON backend {0!r} is not installed'.format(name))
+
+
+def output_json(data, code, headers=None):
+    """Make a response with a JSON encoded body."""
+    if current_app.config.get('JSON_PRETTY'):
+        settings = dict(current_app.config.get('RESTFUL_JSON', {}))
+        settings.setdefault('indent', 4)
+        body = json.dumps(data, **settings) + '\n'
+    else:
+        body = dumps(data) + b'\n'
+    response = make_response(body, code)
+    response.headers.extend(headers or {})
+    response.vary.add('Accept')
+    return response
+
+
+def output_msgpack(data, code, headers=None):
+    """Make a response with a MessagePack encoded body."""
+    response = make_response(msgpack.packb(data, use_bin_type=True), code)
+    response.headers.extend(headers or {})
+    response.vary.add('Accept')
+    return response
+
+
+def register_representations(api):
+    """Use these representations for the resources of ``api``."""
+    REPRESENTATIONS[DEFAULT_MIMETYPE] = output_json
+    if msgpack is not None:
+        for mimetype in MSGPACK_MIMETYPES:
+            REPRESENTATIONS[mimetype] = output_msgpack
+    api.representations.update(REPRESENTATIONS)
+
+
+def negotiated_mimetype():
+    """Return the media type of the representation the API responds to the
+    current request with, picked like
+    :meth:`flask_restful.Api.make_response` does.
+    """
+    return request.accept_mimetypes.best_match(REPRESENTATIONS,
+                                               default=DEFAULT_MIMETYPE)
+
+
+def representation_etag(etag):
+    """Return ``etag`` for the representation negotiated for the current
+    request: as is for JSON, with a suffix naming the encoding otherwise.
+    """
+    suffix = ETAG_SUFFIXES.get(negotiated_mimetype())
+    if etag is None or suffix is None:
+        return etag
+    return '{0}-{1}'.format(etag, suffix)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""Read replica routing.
+
+Queries run while handling ``GET`` and ``HEAD`` requests go to one of the
+replicas listed in ``DB_REPLICA_URIS``; everything else uses the primary.
+A request sticks to the replica it first picked, and once it writes
+anything (a flush, or a bulk ``UPDATE``/``DELETE``) the rest of it reads
+from the primary too, so it always sees its own writes.
+
+A replica that cannot be connected to is skipped for ``DB_REPLICA_RETRY``
+seconds and the query that hit it is retried on the primary. With no
+replicas configured, or none reachable, all queries go to the primary.
+"""
+
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import exc, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger('demo.routing')
+
+READ_METHODS = frozenset(['GET', 'HEAD'])
+
+# SQLALCHEMY_BINDS keys of the replica engines
+REPLICA_BIND = 'replica_{0}'
+
+
+class ReplicaHealth(object):
+    """Remembers which replica engines failed recently."""
+
+    def __init__(self):
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def mark_down(self, engine, seconds):
+        with self._lock:
+            self._down_until[engine] = time.time() + seconds
+
+    def is_up(self, engine):
+        return self._down_until.get(engine, 0) <= time.time()
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from a replica during read-only requests."""
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self._flushing or isinstance(clause, UpdateBase):
+            # Writing: this request reads its own writes from now on
+            self.db.pin_primary()
+        elif mapper is None or \
+                mapper.persist_selectable.info.get('bind_key') is None:
+            replica = self.db.replica_for_request()
+            if replica is not None:
+                return replica
+        return SignallingSession.get_bind(self, mapper, clause, **kwargs)
+
+    def _connection_for_bind(self, engine, execution_options=None, **kw):
+        # Both Query and Session.execute() connect through here
+        try:
+            return SignallingSession._connection_for_bind(
+                self, engine, execution_options, **kw)
+        except exc.DBAPIError:
+            if not self.db.is_replica(engine):
+                raise
+            self.db.replica_failed(engine)
+            return SignallingSession._connection_for_bind(
+                self, self.db.get_engine(self.app), execution_options, **kw)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """:class:`SQLAlchemy` that routes reads to replicas.
+
+    Config:
+
+    * ``DB_REPLICA_URIS``: database URIs of the replicas
+    * ``DB_REPLICA_RETRY``: seconds to leave a failed replica unused
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.health = ReplicaHealth()
+        self._next_replica = itertools.count()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    def init_app(self, app):
+        app.config.setdefault('DB_REPLICA_URIS', [])
+        app.config.setdefault('DB_REPLICA_RETRY', 30)
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        replicas = []
+        for i, uri in enumerate(app.config['DB_REPLICA_URIS']):
+            replicas.append(REPLICA_BIND.format(i))
+            binds[replicas[-1]] = uri
+        if replicas:
+            app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['db_replicas'] = replicas
+        SQLAlchemy.init_app(self, app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def primary_binds(self, app=None):
+        """Every bind key but the replicas', which get their schema from
+        replication.
+        """
+        app = self.get_app(app)
+        replicas = app.extensions.get('db_replicas', ())
+        return [None] + [key for key in app.config.get('SQLALCHEMY_BINDS')
+                         or () if key not in replicas]
+
+    def create_all(self, bind='__all__', app=None):
+        if bind == '__all__':
+            bind = self.primary_binds(app)
+        SQLAlchemy.create_all(self, bind, app)
+
+    def drop_all(self, bind='__all__', app=None):
+        if bind == '__all__':
+            bind = self.primary_binds(app)
+        SQLAlchemy.drop_all(self, bind, app)
+
+    def replicas(self, app):
+        return [self.get_engine(app, bind=key)
+                for key in app.extensions.get('db_replicas', ())]
+
+    def is_replica(self, engine):
+        app = current_app._get_current_object()
+        return engine in self.replicas(app)
+
+    def replica_for_request(self):
+        """Return the replica engine the current request reads from, or None
+        to use the primary.
+        """
+        if not has_request_context() or request.method not in READ_METHODS:
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = self.choose_replica()
+        return g.db_replica
+
+    def choose_replica(self):
+        """Pick a healthy replica, round robin, or None if there is none."""
+        app = current_app._get_current_object()
+        replicas = [engine for engine in self.replicas(app)
+                    if self.health.is_up(engine)]
+        if not replicas:
+            return None
+        return replicas[next(self._next_replica) % len(replicas)]
+
+    def pin_primary(self):
+        """Send the rest of the current request's queries to the primary."""
+        if has_request_context():
+            g.db_replica = None
+
+    def replica_failed(self, engine):
+        # repr() of a URL masks its password
+        logger.warning('Replica %r is unavailable, using the primary',
+                       engine.url)
+        self.health.mark_down(engine,
+                              current_app.config['DB_REPLICA_RETRY'])
+        self.pin_primary()
@@ -3,12 +3,122 @@
 import os
 
 
+def engine_options(environ=os.environ):
+    """SQLAlchemy engine and pool options for a server database, tuned for
+    the gunicorn worker class and overridable from the environment:
+
+    * ``DB_EXTERNAL_POOLER``: when ``true`` (e.g. behind PgBouncer) keep no
+      connections open in the app at all
+    * ``DB_POOL_SIZE``: defaults to the worker's concurrency, i.e.
+      ``GUNICORN_THREADS`` for sync and threaded workers and
+      ``GUNICORN_WORKER_CONNECTIONS`` (capped at 20) for gevent and eventlet
+    * ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``, ``DB_POOL_RECYCLE``
+    * ``DB_POOL_PRE_PING``: test connections before use, defaults to true
+    * ``DB_STATEMENT_TIMEOUT_MS``: PostgreSQL ``statement_timeout``
+    """
+    from demo.metrics import MeasuredQueuePool
+    from sqlalchemy.pool import NullPool
+
+    options = {
+        'pool_pre_ping': environ.get('DB_POOL_PRE_PING', 'true') == 'true',
+    }
+    statement_timeout = int(environ.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if statement_timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={0}'.format(statement_timeout),
+        }
+
+    if environ.get('DB_EXTERNAL_POOLER') == 'true':
+        options['poolclass'] = NullPool
+        return options
+
+    worker_class = environ.get('GUNICORN_WORKER_CLASS', 'sync')
+    if worker_class in ('gevent', 'eventlet'):
+        concurrency = min(
+            int(environ.get('GUNICORN_WORKER_CONNECTIONS', 2000)), 20)
+    else:
+        concurrency = int(environ.get('GUNICORN_THREADS', 1))
+
+    options.update(
+        poolclass=MeasuredQueuePool,
+        pool_size=int(environ.get('DB_POOL_SIZE', concurrency)),
+        max_overflow=int(environ.get('DB_MAX_OVERFLOW', 0)),
+        pool_timeout=int(environ.get('DB_POOL_TIMEOUT', 10)),
+        pool_recycle=int(environ.get('DB_POOL_RECYCLE', 300)),
+    )
+    return options
+
+
 class Config(object):
     APP_DIR = os.path.abspath(os.path.dirname(__file__))  # This directory
     PROJECT_ROOT = os.path.abspath(os.path.join(APP_DIR, os.pardir))
 
     ERROR_404_HELP = False
 
+    # Successful Basic auth verifications are remembered per worker so that
+    # repeat requests skip the user lookup and password hash. 0 disables.
+    # Only the worker that changes a password, renames or deletes a user
+    # drops its entries: in the others the old credentials keep working for
+    # up to AUTH_CACHE_TTL seconds, so keep it short.
+    AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 1024))
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))
+
+    # Signs bearer tokens, which POST /api/tokens issues in exchange for
+    # Basic credentials. Tokens are checked by signature and expire after
+    # AUTH_TOKEN_TTL seconds, or when the user's password changes (other
+    # workers notice once their auth cache entry expires).
+    SECRET_KEY = os.getenv('SECRET_KEY', 'not-so-secret')
+    AUTH_TOKEN_TTL = int(os.getenv('AUTH_TOKEN_TTL', 3600))
+
+    # Serialized responses of the public user endpoints, per worker. Writes
+    # to users invalidate them. 0 disables.
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 60))
+
+    # How paginated endpoints count their totals: exact, cached (per
+    # filter, invalidated by writes), counter (denormalized counts where an
+    # endpoint keeps them, exact otherwise) or estimate (PostgreSQL planner
+    # estimates, exact below COUNT_ESTIMATE_MIN rows)
+    PAGINATE_COUNT = os.getenv('PAGINATE_COUNT', 'exact')
+    COUNT_CACHE_SIZE = int(os.getenv('COUNT_CACHE_SIZE', 1024))
+    COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', 60))
+    COUNT_ESTIMATE_MIN = int(os.getenv('COUNT_ESTIMATE_MIN', 1000))
+
+    # Make model saves inside a request flush only and commit once when the
+    # request finishes successfully
+    DB_UNIT_OF_WORK = os.getenv('DB_UNIT_OF_WORK', 'true') == 'true'
+
+    # Size the connection pool for the gunicorn worker, from the environment
+    # at create_app time; see engine_options
+    DB_SERVER_POOL = False
+
+    # Seconds to send reads to the primary after failing to reach a replica
+    DB_REPLICA_RETRY = int(os.getenv('DB_REPLICA_RETRY', 30))
+
+    # Report per-request SQL counts and timings in a Server-Timing header
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'true') == 'true'
+    # Statements slower than this are logged as warnings
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 100))
+
+    # JSON encoder for API responses: auto (fastest installed), orjson,
+    # ujson or json. Responses are compact unless JSON_PRETTY is set.
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+    JSON_PRETTY = False
+
+    # Compress responses of at least COMPRESS_MIN_SIZE bytes with brotli
+    # (if installed) or gzip
+    COMPRESS_ENABLED = os.getenv('COMPRESS_ENABLED', 'true') == 'true'
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+    COMPRESS_BROTLI_LEVEL = int(os.getenv('COMPRESS_BROTLI_LEVEL', 4))
+
+    # Prometheus metrics endpoint
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true') == 'true'
+    METRICS_PATH = '/metrics'
+
+    # Maximum number of operations in one task batch request
+    TASK_BATCH_MAX = int(os.getenv('TASK_BATCH_MAX', 1000))
+
     OPBEAT = {
         'ORGANIZATION_ID': os.getenv('OPBEAT_ORG_ID'),
         'APP_ID': os.getenv('OPBEAT_APP_ID'),
@@ -23,12 +133,19 @@ class ProdConfig(Config):
     DEBUG = False
     # DB URL variable set by heroku
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', '')
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+    # Comma separated URLs of read replicas for GET requests
+    DB_REPLICA_URIS = [url for url in
+                       os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                       if url]
+    DB_SERVER_POOL = True
 
 
 class DevConfig(Config):
     """Development configuration."""
     ENV = 'dev'
     DEBUG = True
+    JSON_PRETTY = True
     DB_NAME = 'dev.db'
     DB_PATH = os.path.join(Config.PROJECT_ROOT, DB_NAME)
     SQLALCHEMY_DATABASE_URI = 'sqlite:///{0}'.format(DB_PATH)
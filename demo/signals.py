@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""Signals sent by the application."""
+
+from blinker import Namespace
+
+signals = Namespace()
+
+# Sent with the model class as sender after a transaction that inserted,
+# updated or deleted records of that model commits
+model_changed = signals.signal('model-changed')
@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 
+import gc
+import glob
 import os
+import tempfile
 
 #
 # Server socket
@@ -112,6 +115,21 @@ graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 0))
 keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 2))
 threads = int(os.getenv('GUNICORN_THREADS', 1))
 
+#
+# Cooperative mode
+#
+#   With gevent workers the standard library is monkey patched here,
+#   before the app is imported (also when it is preloaded), and post_fork
+#   makes psycopg2 wait for the database through the gevent hub so that a
+#   worker keeps serving other requests during queries. Each worker's
+#   connection pool is sized for worker_connections, see
+#   demo.settings.engine_options.
+#
+
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 #
 # Debugging
 #
@@ -142,6 +160,12 @@ spew = False
 #
 #       True or False
 #
+#   preload_app - Load the application in the master before forking the
+#       workers, which then start without importing it and share its
+#       memory copy-on-write. Incompatible with reload.
+#
+#       True or False
+#
 #   pidfile - The path to a pid file to write
 #
 #       A path string or None to not write a pid file.
@@ -174,6 +198,7 @@ spew = False
 #
 
 daemon = False
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true') == 'true' and not reload
 pidfile = None
 umask = 0
 user = None
@@ -210,3 +235,66 @@ accesslog = '-'
 #
 
 proc_name = None
+
+#
+# Copy-on-write
+#
+#   Collections touch the header of every tracked object, copying the
+#   pages a preloaded app shares with the workers. Python 3.7+ can freeze
+#   the objects allocated so far out of the collector's reach: the master
+#   leaves collection off while loading the app, freezes everything and
+#   turns collection back on once it is ready, and freezes again before
+#   each fork so workers inherit nothing it allocated since.
+#
+
+gc_freeze = (preload_app and hasattr(gc, 'freeze') and
+             os.getenv('GUNICORN_GC_FREEZE', 'true') == 'true')
+if gc_freeze:
+    gc.disable()
+
+#
+# Metrics
+#
+#   Workers write Prometheus samples to mmap'd files in
+#   PROMETHEUS_MULTIPROC_DIR so that /metrics served by any worker reports
+#   all of them. The directory is emptied when the server starts and the
+#   live gauges of a worker are dropped when it exits.
+#
+
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(
+        prefix='demo-metrics-')
+
+
+def on_starting(server):
+    for path in glob.glob(os.path.join(
+            os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
+
+
+def when_ready(server):
+    if gc_freeze:
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    if gc_freeze:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if server.cfg.worker_class_str == 'gevent':
+        from demo.green import make_psycopg2_green
+        make_psycopg2_green()
+
+    # A preloaded app may have opened connections in the master; a worker
+    # must start with its own
+    if server.cfg.preload_app:
+        from demo.database import dispose_engines
+        dispose_engines(server.app.wsgi())
+
+
+def child_exit(server, worker):
+    from demo.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
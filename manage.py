@@ -5,6 +5,7 @@ from flask_script import Manager, Shell, Server
 from flask_migrate import MigrateCommand
 
 from demo import create_app
+from demo.bulk import BATCH_SIZE, import_files
 from demo.models.user import User
 from demo.database import db
 
@@ -20,6 +21,25 @@ def _make_context():
     return {'app': app, 'db': db, 'User': User}
 
 
+@manager.option('-u', '--users', help='JSON lines or CSV file of users')
+@manager.option('-t', '--tasks', help='JSON lines or CSV file of tasks')
+@manager.option('-b', '--batch-size', dest='batch_size', type=int,
+                default=BATCH_SIZE, help='rows per insert')
+@manager.option('-p', '--processes', type=int,
+                help='password hashing processes, one per CPU by default')
+def import_data(users=None, tasks=None, batch_size=BATCH_SIZE,
+                processes=None):
+    """Bulk import users and tasks, see demo.bulk."""
+    def progress(kind, rows, seconds):
+        print('{0}: {1} rows, {2:.0f} rows/s'.format(
+            kind, rows, rows / seconds if seconds else 0))
+
+    for kind, rows, seconds in import_files(users, tasks, batch_size,
+                                            processes, progress):
+        print('Imported {0} {1} in {2:.1f}s ({3:.0f} rows/s)'.format(
+            rows, kind, seconds, rows / seconds if seconds else 0))
+
+
 @manager.command
 def test():
     """Run the tests."""
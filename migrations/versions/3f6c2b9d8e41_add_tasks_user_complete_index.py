@@ -0,0 +1,22 @@
+"""Add composite index for task collection queries
+
+Revision ID: 3f6c2b9d8e41
+Revises: 1aef3e1e33a2
+Create Date: 2026-10-18 09:12:44.318502
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2b9d8e41'
+down_revision = '1aef3e1e33a2'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_tasks_user_id_complete_id', 'tasks',
+                    ['user_id', 'complete', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tasks_user_id_complete_id', table_name='tasks')
@@ -0,0 +1,38 @@
+"""Add denormalized task counts to users
+
+Revision ID: 5c9e0b7a3d12
+Revises: 8a1d4e7c2f90
+Create Date: 2026-10-18 14:21:06.318452
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5c9e0b7a3d12'
+down_revision = '8a1d4e7c2f90'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('users', sa.Column('task_count', sa.Integer(),
+                                     nullable=False, server_default='0'))
+    op.add_column('users', sa.Column('open_task_count', sa.Integer(),
+                                     nullable=False, server_default='0'))
+
+    users = sa.table('users', sa.column('id'), sa.column('task_count'),
+                     sa.column('open_task_count'))
+    tasks = sa.table('tasks', sa.column('user_id'),
+                     sa.column('complete', sa.Boolean))
+    owned = tasks.c.user_id == users.c.id
+    op.execute(users.update().values(
+        task_count=sa.select([sa.func.count()]).where(owned).as_scalar(),
+        open_task_count=sa.select([sa.func.count()]).where(
+            owned & (tasks.c.complete == sa.false())).as_scalar(),
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('open_task_count')
+        batch_op.drop_column('task_count')
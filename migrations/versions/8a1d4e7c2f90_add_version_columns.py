@@ -0,0 +1,28 @@
+"""Add version columns for entity tags
+
+Revision ID: 8a1d4e7c2f90
+Revises: 3f6c2b9d8e41
+Create Date: 2026-10-18 10:03:27.905118
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8a1d4e7c2f90'
+down_revision = '3f6c2b9d8e41'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('users', sa.Column('version', sa.Integer(), nullable=False,
+                                     server_default='1'))
+    op.add_column('tasks', sa.Column('version', sa.Integer(), nullable=False,
+                                     server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('tasks') as batch_op:
+        batch_op.drop_column('version')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,24 @@
+"""Add password versions to users
+
+Revision ID: b7e4f1a9c620
+Revises: 5c9e0b7a3d12
+Create Date: 2026-10-18 16:02:44.107391
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b7e4f1a9c620'
+down_revision = '5c9e0b7a3d12'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('users', sa.Column('password_version', sa.Integer(),
+                                     nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('password_version')
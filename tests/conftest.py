@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Fixtures shared by the tests."""
+
+import base64
+
+import pytest
+
+from demo import create_app
+from demo.database import db as _db
+from demo.models.user import User
+from demo.settings import TestConfig
+
+
+@pytest.fixture
+def app():
+    app = create_app(TestConfig)
+    context = app.app_context()
+    context.push()
+    yield app
+    context.pop()
+
+
+@pytest.fixture
+def db(app):
+    _db.create_all()
+    yield _db
+    _db.session.remove()
+    _db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def basic_auth(username, password):
+    """Return the headers of a request with HTTP Basic credentials."""
+    credentials = '{0}:{1}'.format(username, password).encode('utf-8')
+    return {'Authorization':
+            'Basic ' + base64.b64encode(credentials).decode('ascii')}
+
+
+def detached(instance):
+    """Load ``instance`` and take it out of the session, which requests
+    share with the test, so that they have to query for it themselves.
+    """
+    _db.session.refresh(instance)
+    _db.session.expunge(instance)
+    return instance
+
+
+@pytest.fixture
+def user(db):
+    return detached(User.create(username='alice', email='alice@example.com',
+                                password='secret'))
+
+
+@pytest.fixture
+def headers(user):
+    return basic_auth('alice', 'secret')
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.api.auth."""
+
+import base64
+import time
+
+import pytest
+
+from demo.extensions import credential_cache, token_cache
+from demo.instrumentation import count_queries
+from demo.models.task import Task
+from demo.models.user import User
+
+from .conftest import basic_auth
+
+
+def user_queries(stats):
+    return sum(count for statement, count in stats.statements.items()
+               if statement.startswith('SELECT') and 'FROM users' in statement)
+
+
+@pytest.fixture
+def alice(db):
+    user = User.create(username='alice', email='alice@example.com',
+                       password='secret')
+    Task.create(user_id=user.id, summary='Write tests')
+    credential_cache.clear()
+    return user
+
+
+def test_task_collection_reuses_authenticated_user(client, alice):
+    headers = basic_auth('alice', 'secret')
+
+    with count_queries() as stats:
+        response = client.get('/api/users/alice/tasks', headers=headers)
+    assert response.status_code == 200
+    # Loaded once to check the password, then looked up again by the view
+    # from the request's lookups
+    assert user_queries(stats) == 1
+
+    with count_queries() as stats:
+        response = client.get('/api/users/alice/tasks', headers=headers)
+    assert response.status_code == 200
+    # Rebuilt from the credential cache, which the view reuses as well
+    assert user_queries(stats) == 0
+
+
+def bearer(token):
+    return {'Authorization': 'Bearer ' + token}
+
+
+def issue_token(client, headers):
+    response = client.post('/api/tokens', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_token_issued_for_password(app, client, headers):
+    body = issue_token(client, headers)
+    assert body['expires_in'] == app.config['AUTH_TOKEN_TTL']
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(body['token'])).status_code == 200
+
+
+@pytest.mark.parametrize('credentials', [
+    None,
+    basic_auth('alice', 'wrong'),
+    basic_auth('nobody', 'secret'),
+])
+def test_token_requires_password(client, user, credentials):
+    assert client.post('/api/tokens',
+                       headers=credentials).status_code == 401
+
+
+def test_token_cannot_renew_itself(client, headers):
+    token = issue_token(client, headers)['token']
+    assert client.post('/api/tokens',
+                       headers=bearer(token)).status_code == 401
+
+
+def test_token_authenticates_its_user_only(client, headers, user):
+    User.create(username='bob', email='bob@example.com', password='secret')
+    token = issue_token(client, headers)['token']
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 200
+    assert client.get('/api/users/bob/tasks',
+                      headers=bearer(token)).status_code == 403
+
+
+@pytest.mark.parametrize('token', ['', 'garbage', 'a.b.c'])
+def test_invalid_token_rejected(client, user, token):
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 401
+
+
+def test_tampered_token_rejected(client, headers):
+    token = issue_token(client, headers)['token']
+    # Another user id, with alice's signature
+    forged = base64.urlsafe_b64encode(b'[2,1]').decode('ascii').rstrip('=')
+    forged += '.' + token.split('.', 1)[1]
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(forged)).status_code == 401
+
+
+def test_expired_token_rejected(app, client, headers, monkeypatch):
+    # Issued longer than AUTH_TOKEN_TTL ago
+    issued = time.time() - app.config['AUTH_TOKEN_TTL'] - 10
+    with monkeypatch.context() as patch:
+        patch.setattr(time, 'time', lambda: issued)
+        token = issue_token(client, headers)['token']
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 401
+
+
+def test_password_change_revokes_tokens(client, headers):
+    token = issue_token(client, headers)['token']
+    # Cached by its first use
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 200
+
+    response = client.post('/api/users/alice', json={'password': 'changed'},
+                           headers=bearer(token))
+    assert response.status_code == 200
+
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 401
+    assert client.get('/api/users/alice/tasks',
+                      headers=headers).status_code == 401
+    new_headers = basic_auth('alice', 'changed')
+    token = issue_token(client, new_headers)['token']
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 200
+
+
+def test_password_change_seen_by_other_workers(db, client, headers, user):
+    token = issue_token(client, headers)['token']
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 200
+
+    # Changed through another worker, whose cache invalidation this one
+    # never sees; it notices once its own entry expires
+    users = User.__table__
+    db.session.execute(users.update().where(users.c.id == user.id)
+                       .values(password_version=users.c.password_version + 1))
+    db.session.commit()
+    token_cache.clear()
+    assert client.get('/api/users/alice/tasks',
+                      headers=bearer(token)).status_code == 401
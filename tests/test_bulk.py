@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.bulk."""
+
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+from demo.bulk import _copy_buffer, import_files, insert_rows, read_records
+from demo.models.task import Task
+from demo.models.user import User
+
+ROWS = [
+    ('alice', 'alice@example.com', 'hash', None, u'Tab\there'),
+    ('bob', 'bob@example.com', 'hash', '', u'Back\\slash\nnewline'),
+]
+
+
+def _parse_copy(line):
+    # The inverse of demo.bulk._copy_value for text fields
+    fields = []
+    for field in line.split('\t'):
+        if field == '\\N':
+            fields.append(None)
+            continue
+        value, escaped = [], False
+        for char in field:
+            if escaped:
+                value.append(
+                    {'t': '\t', 'n': '\n', 'r': '\r'}.get(char, char))
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            else:
+                value.append(char)
+        fields.append(''.join(value))
+    return tuple(fields)
+
+
+def test_copy_buffer_round_trip():
+    lines = _copy_buffer(ROWS).read().split('\n')
+    assert lines[-1] == ''
+    assert [_parse_copy(line) for line in lines[:-1]] == ROWS
+
+
+def test_copy_buffer_keeps_null_apart_from_empty():
+    line = _copy_buffer([(None, '', True, 1)]).read()
+    assert line == '\\N\t\tt\t1\n'
+
+
+@pytest.mark.skipif(not (os.getenv('TEST_INTEGRATION') and
+                         os.getenv('TEST_DATABASE_URL')),
+                    reason='needs TEST_INTEGRATION and a PostgreSQL '
+                           'TEST_DATABASE_URL')
+def test_copy_round_trip_postgresql():
+    engine = create_engine(os.environ['TEST_DATABASE_URL'])
+    users = User.__table__
+    columns = ('username', 'email', 'password_hash', 'first_name',
+               'last_name')
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            users.create(connection, checkfirst=True)
+            insert_rows(connection, users, columns, ROWS)
+            stored = connection.execute(
+                users.select().where(users.c.username.in_(['alice', 'bob']))
+                .order_by(users.c.username)).fetchall()
+        finally:
+            transaction.rollback()
+    assert [tuple(row[name] for name in columns) for row in stored] == ROWS
+
+
+USERS_CSV = u"""username,email,password,first_name,last_name
+alice,alice@example.com,secret,Alice,
+bob,bob@example.com,secret,,Builder
+carol,carol@example.com,secret
+"""
+
+TASKS_CSV = u"""username,summary,complete
+alice,Write tests,
+bob,Fix the roof,true
+"""
+
+
+@pytest.fixture
+def csv_files(tmp_path):
+    users, tasks = tmp_path / 'users.csv', tmp_path / 'tasks.csv'
+    users.write_text(USERS_CSV, encoding='utf-8')
+    tasks.write_text(TASKS_CSV, encoding='utf-8')
+    return str(users), str(tasks)
+
+
+def test_read_csv_empty_and_missing_columns(csv_files):
+    records = list(read_records(csv_files[0]))
+    assert records[0]['last_name'] is None
+    assert records[1]['first_name'] is None
+    # Short row
+    assert records[2]['first_name'] is None
+    assert records[2]['last_name'] is None
+
+
+def test_import_csv_with_empty_columns(db, csv_files):
+    users, tasks = csv_files
+    results = import_files(users=users, tasks=tasks, processes=1)
+    assert [(kind, rows) for kind, rows, seconds in results] == [
+        ('users', 3), ('tasks', 2)]
+
+    alice, bob, carol = User.query.order_by(User.id).all()
+    assert (alice.first_name, alice.last_name) == ('Alice', None)
+    assert (bob.first_name, bob.last_name) == (None, 'Builder')
+    assert (carol.first_name, carol.last_name) == (None, None)
+    assert alice.check_password('secret')
+    assert [(task.summary, task.complete)
+            for task in Task.query.order_by(Task.id)] == [
+        ('Write tests', False), ('Fix the roof', True)]
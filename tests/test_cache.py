@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.cache."""
+
+from demo.extensions import response_cache
+from demo.models.task import Task
+from demo.models.user import User
+
+
+def test_generation_changes_on_commit_not_flush(db):
+    user = User.create(username='alice', email='alice@example.com',
+                       password='secret')
+    before = response_cache.generation('tasks')
+
+    Task(user_id=user.id, summary='Flushed').save(commit=False)
+    db.session.flush()
+    assert response_cache.generation('tasks') == before
+
+    db.session.commit()
+    assert response_cache.generation('tasks') != before
+
+
+def test_generation_kept_on_rollback(db):
+    user = User.create(username='alice', email='alice@example.com',
+                       password='secret')
+    before = response_cache.generation('tasks')
+
+    Task.bulk_create([{'user_id': user.id, 'summary': 'Rolled back'}],
+                     commit=False)
+    db.session.rollback()
+    db.session.commit()
+    assert response_cache.generation('tasks') == before
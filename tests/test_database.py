@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.database."""
+
+import pytest
+from flask import abort
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from demo.instrumentation import count_queries
+from demo.models.task import Task
+from demo.models.user import User
+
+
+def test_bulk_create_writes_back_keys_in_one_insert(db):
+    user = User.create(username='alice', email='alice@example.com',
+                       password='secret')
+    Task.create(user_id=user.id, summary='Existing')
+    mappings = [{'user_id': user.id, 'summary': 'Task %d' % i}
+                for i in range(5)]
+    mappings[2]['complete'] = True
+
+    with count_queries() as stats:
+        Task.bulk_create(mappings)
+    inserts = sum(count for statement, count in stats.statements.items()
+                  if statement.startswith('INSERT'))
+    assert inserts == 1
+
+    for mapping in mappings:
+        task = Task.query.get(mapping['id'])
+        assert task.summary == mapping['summary']
+        assert task.complete is mapping.get('complete', False)
+        assert task.version == 1
+
+
+@pytest.fixture
+def commits(db):
+    """Count the commits of the session."""
+    counted = []
+
+    def after_commit(session):
+        counted.append(session)
+    event.listen(db.session, 'after_commit', after_commit)
+    yield counted
+    event.remove(db.session, 'after_commit', after_commit)
+
+
+@pytest.fixture
+def route(app, user):
+    """Add a view at ``/work`` that creates two tasks and then runs
+    ``finish``, and return a function setting ``finish``.
+    """
+    finish = []
+
+    @app.route('/work', methods=['POST'])
+    def work():
+        Task.create(user_id=user.id, summary='First')
+        Task.create(user_id=user.id, summary='Second')
+        return finish[0]()
+
+    return finish.append
+
+
+def test_unit_of_work_commits_once_on_success(db, client, route, commits):
+    route(lambda: ('done', 201))
+    assert client.post('/work').status_code == 201
+    assert len(commits) == 1
+    db.session.rollback()
+    assert Task.query.count() == 2
+
+
+@pytest.mark.parametrize('finish', [
+    lambda: ('invalid', 400),
+    lambda: abort(409),
+])
+def test_unit_of_work_rolls_back_error_responses(db, client, route,
+                                                 commits, finish):
+    route(finish)
+    assert client.post('/work').status_code >= 400
+    assert not commits
+    assert Task.query.count() == 0
+
+
+def test_unit_of_work_rolls_back_when_view_raises(app, db, client, route,
+                                                  commits):
+    def finish():
+        raise RuntimeError('view failed')
+    route(finish)
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    assert client.post('/work').status_code == 500
+    assert not commits
+    assert Task.query.count() == 0
+
+
+def test_unit_of_work_reports_commit_failure(app, db, client, route,
+                                             commits):
+    def before_commit(session):
+        raise OperationalError('COMMIT', {}, Exception('disk I/O error'))
+    event.listen(db.session, 'before_commit', before_commit)
+    route(lambda: ('done', 201))
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    try:
+        assert client.post('/work').status_code == 500
+    finally:
+        event.remove(db.session, 'before_commit', before_commit)
+    assert not commits
+    assert Task.query.count() == 0
+
+
+def test_commit_session_without_unit_of_work(app, db, client, route,
+                                             commits):
+    app.config['DB_UNIT_OF_WORK'] = False
+    route(lambda: ('done', 201))
+    assert client.post('/work').status_code == 201
+    # One per save
+    assert len(commits) == 2
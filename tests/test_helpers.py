@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.helpers."""
+
+import pytest
+
+from demo import helpers
+from demo.models.task import Task
+from demo.models.user import User
+
+from .conftest import detached
+
+
+@pytest.fixture
+def tasks(user):
+    return [detached(Task.create(user_id=user.id, summary='Task %d' % i))
+            for i in range(5)]
+
+
+def test_record_etag_and_conditional_get(client, user):
+    response = client.get('/api/users/1')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag == '"{0}"'.format(user.etag)
+
+    response = client.get('/api/users/1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert not response.get_data()
+
+    response = client.get('/api/users/1',
+                          headers={'If-None-Match': '"1.0"'})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag
+
+
+def test_record_etag_changes_with_version(client, headers, tasks):
+    path = '/api/users/alice/tasks/1'
+    etag = client.get(path, headers=headers).headers['ETag']
+
+    response = client.post(path, json={'summary': 'Renamed'},
+                           headers=headers)
+    assert response.status_code == 200
+
+    response = client.get(path, headers=dict(headers, **{
+        'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.get_json()['summary'] == 'Renamed'
+    assert response.headers['ETag'] != etag
+    assert response.headers['ETag'] == '"1.2"'
+
+
+def test_page_etag_and_conditional_get(client, headers, tasks):
+    path = '/api/users/alice/tasks?per_page=2'
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    response = client.get(path, headers=dict(headers, **{
+        'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+    # Another page, or the same page after a write, has another tag
+    other = client.get(path + '&page=2', headers=headers)
+    assert other.headers['ETag'] != etag
+    client.post('/api/users/alice/tasks/2', json={'summary': 'Renamed'},
+                headers=headers)
+    response = client.get(path, headers=dict(headers, **{
+        'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def page(client, url):
+    response = client.get(url)
+    assert response.status_code == 200, response.get_data()
+    body = response.get_json()
+    return [item['id'] for item in body['items']], body['meta']
+
+
+@pytest.fixture
+def users(db):
+    # Ids 1-7; keyset pages are ordered by id
+    return [detached(User.create(username='user%d' % i,
+                                 email='user%d@example.com' % i,
+                                 password='secret'))
+            for i in range(1, 8)]
+
+
+def test_keyset_cursor_round_trip(client, users):
+    ids, meta = page(client, '/api/users?after=&per_page=3')
+    assert ids == [1, 2, 3]
+    assert meta['page'] is None
+    assert meta['total'] == 7
+    assert meta['links']['prev'] is None
+
+    seen = ids
+    while meta['links'].get('next'):
+        ids, meta = page(client, meta['links']['next'])
+        seen += ids
+    assert seen == [1, 2, 3, 4, 5, 6, 7]
+    # The last page is short and has no next link
+    assert ids == [7]
+    assert meta['links']['next'] is None
+
+    # And back again
+    ids, meta = page(client, meta['links']['prev'])
+    assert ids == [4, 5, 6]
+    ids, meta = page(client, meta['links']['prev'])
+    assert ids == [1, 2, 3]
+    assert meta['links']['prev'] is None
+
+
+def test_keyset_last_page(client, users):
+    ids, meta = page(client, '/api/users?before=&per_page=3')
+    assert ids == [5, 6, 7]
+    assert meta['links']['next'] is None
+    ids, meta = page(client, meta['links']['prev'])
+    assert ids == [2, 3, 4]
+    ids, meta = page(client, meta['links']['prev'])
+    assert ids == [1]
+    assert meta['links']['prev'] is None
+
+
+def test_keyset_empty_past_the_end(client, users):
+    ids, meta = page(client, '/api/users?after={0}'.format(
+        helpers.encode_cursor(7)))
+    assert ids == []
+    assert meta['links']['next'] is None
+
+
+@pytest.mark.parametrize('cursor', ['not a cursor!', 'YWJj', '%%%'])
+def test_keyset_bad_cursor(client, users, cursor):
+    assert client.get('/api/users?after=' + cursor).status_code == 400
+    assert client.get('/api/users?before=' + cursor).status_code == 400
+
+
+def test_keyset_ties_broken_by_id(client, headers, user):
+    # Tasks with the same summary and completion still page by id, with
+    # nothing skipped or repeated
+    for _ in range(6):
+        detached(Task.create(user_id=user.id, summary='Same', complete=True))
+    url = '/api/users/alice/tasks?complete=1&after=&per_page=4'
+    response = client.get(url, headers=headers)
+    body = response.get_json()
+    ids = [item['id'] for item in body['items']]
+    response = client.get(body['meta']['links']['next'], headers=headers)
+    ids += [item['id'] for item in response.get_json()['items']]
+    assert ids == [1, 2, 3, 4, 5, 6]
+    # Filters are kept in the links
+    assert 'complete=1' in body['meta']['links']['next']
+
+
+def test_keyset_without_count(client, users):
+    ids, meta = page(client, '/api/users?after=&per_page=3&count=false')
+    assert ids == [1, 2, 3]
+    assert meta['total'] is None and meta['pages'] is None
+    assert 'count=false' in meta['links']['next']
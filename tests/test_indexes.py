@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Check that the task collection queries are served by
+``ix_tasks_user_id_complete_id``.
+"""
+
+import pytest
+
+from demo.api.task import filter_tasks
+from demo.models.task import Task
+
+INDEX = 'ix_tasks_user_id_complete_id'
+
+
+def query_plan(db, query):
+    statement = query.statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute('EXPLAIN QUERY PLAN ' + str(statement))
+    return [row[-1] for row in rows]
+
+
+def collection_query(**args):
+    args = dict(dict.fromkeys(('complete', 'summary_prefix',
+                               'summary_contains', 'min_id', 'max_id')),
+                **args)
+    query = Task.query.filter_by(user_id=1).order_by(Task.id)
+    return filter_tasks(query, args).limit(20).offset(0)
+
+
+@pytest.fixture
+def sqlite_db(db):
+    if db.engine.dialect.name != 'sqlite':
+        pytest.skip('EXPLAIN QUERY PLAN is SQLite syntax')
+    return db
+
+
+def test_collection_searches_index(sqlite_db):
+    plan = query_plan(sqlite_db, collection_query())
+    assert any(INDEX in step and 'user_id=?' in step for step in plan), plan
+
+
+def test_complete_filter_searches_index_in_order(sqlite_db):
+    plan = query_plan(sqlite_db, collection_query(complete=1))
+    assert any(INDEX in step and 'user_id=? AND complete=?' in step
+               for step in plan), plan
+    # Rows come out of the index already ordered by id
+    assert not any('TEMP B-TREE' in step for step in plan), plan
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.instrumentation: views stay within their query budgets
+on their most expensive paths. ``QUERY_BUDGET_ENFORCE`` is on under
+TestConfig, so an overrun fails the request with a 500.
+"""
+
+import pytest
+
+from demo import helpers
+from demo.database import db as _db
+from demo.instrumentation import QueryBudgetExceeded, query_budget
+from demo.models.task import Task
+
+from .conftest import detached
+
+STALE = {'If-None-Match': '"stale"'}
+
+
+@pytest.fixture
+def task(user):
+    return detached(Task.create(user_id=user.id, summary='Write tests'))
+
+
+@pytest.fixture
+def small_estimate(app, monkeypatch):
+    # A planner estimate (one query) below COUNT_ESTIMATE_MIN, so that the
+    # exact count runs as well, like on a small PostgreSQL table
+    def estimate_count(query):
+        _db.session.execute('SELECT 1')
+        return 1
+    monkeypatch.setattr(helpers, 'estimate_count', estimate_count)
+    app.config['PAGINATE_COUNT'] = 'estimate'
+
+
+def test_budget_overrun_fails_request(app, client, db):
+    @app.route('/over-budget')
+    @query_budget(1)
+    def over_budget():
+        db.session.execute('SELECT 1')
+        db.session.execute('SELECT 2')
+        return 'done'
+
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/over-budget')
+
+
+def test_user_stale_conditional_get(client, user):
+    response = client.get('/api/users/1', headers=STALE)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"{0}"'.format(user.etag)
+
+
+def test_user_collection_estimated_count(client, user, small_estimate):
+    response = client.get('/api/users')
+    assert response.status_code == 200
+    assert response.get_json()['meta']['total'] == 1
+
+
+def test_task_stale_conditional_get(client, headers, task):
+    response = client.get('/api/users/alice/tasks/{0}'.format(task.id),
+                          headers=dict(headers, **STALE))
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"{0}"'.format(task.etag)
+
+
+def test_task_collection_estimated_count(client, headers, task,
+                                         small_estimate):
+    response = client.get('/api/users/alice/tasks', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['meta']['total'] == 1
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.marshalling: compiled serializers give exactly what
+flask_restful.marshal gives.
+"""
+
+import json
+from collections import OrderedDict
+
+import pytest
+from flask_restful import fields, marshal
+from werkzeug.exceptions import BadRequest
+
+from demo.marshalling import compile_fields, marshal_with
+
+
+class Record(object):
+    def __init__(self, **attrs):
+        self.__dict__.update(attrs)
+
+
+address_fields = OrderedDict([
+    ('street', fields.String),
+    ('zip', fields.Integer(default=0)),
+])
+
+person_fields = OrderedDict([
+    ('id', fields.Integer),
+    ('name', fields.String(attribute='full_name')),
+    ('active', fields.Boolean(default=True)),
+    ('score', fields.Float),
+    ('raw', fields.Raw(default='n/a')),
+    ('city', fields.String(attribute='address.city')),
+    ('address', fields.Nested(address_fields)),
+    ('office', fields.Nested(address_fields, allow_null=True)),
+    ('home', fields.Nested(address_fields, default={'street': 'none'})),
+    ('tags', fields.List(fields.String)),
+    ('previous', fields.List(fields.Nested(address_fields))),
+    ('meta', {'kind': fields.String(default='person')}),
+])
+
+PEOPLE = [
+    Record(id=1, full_name='Alice', active=False, score=1.5, raw=[1, 2],
+           address=Record(street='Main St', zip=12345, city='Springfield'),
+           office=Record(street='Office St', zip=None),
+           home=Record(street='Home St', zip=54321),
+           tags=['a', 'b'],
+           previous=[Record(street='Old St', zip=1), {'street': 'Older St'}],
+           kind='admin'),
+    # Every value None, or missing altogether
+    Record(id=None, full_name=None, active=None, score=None, raw=None,
+           address=None, office=None, home=None, tags=None, previous=None),
+    Record(),
+    {'id': '7', 'full_name': 42, 'active': 1, 'score': '2',
+     'address': {'street': 'Dict St', 'city': 'Dictville'},
+     'previous': {'street': 'Single St'}},
+]
+
+
+def assert_same(data, fields):
+    expected = marshal(data, fields)
+    actual = compile_fields(fields)(data)
+    assert actual == expected
+    # Same key order too, so the encoded bytes are identical
+    assert json.dumps(actual) == json.dumps(expected)
+
+
+@pytest.mark.parametrize('person', PEOPLE)
+def test_compiled_matches_marshal(person):
+    assert_same(person, person_fields)
+
+
+def test_compiled_matches_marshal_for_lists():
+    assert_same(PEOPLE, person_fields)
+    assert_same((PEOPLE[0], PEOPLE[3]), person_fields)
+
+
+def test_compiled_matches_marshal_for_collections():
+    collection_fields = {
+        'items': fields.List(fields.Nested(person_fields)),
+        'count': fields.Integer(attribute='total'),
+    }
+    assert_same({'items': PEOPLE, 'total': 4}, collection_fields)
+    assert_same({'items': None, 'total': None}, collection_fields)
+
+
+@pytest.mark.parametrize('query, selected', [
+    ('id,name', ('id', 'name')),
+    # Declaration order, whatever the order asked for
+    ('address, id', ('id', 'address')),
+    ('', None),
+])
+def test_sparse_fieldsets(app, query, selected):
+    @marshal_with(person_fields, sparse=True)
+    def view():
+        return PEOPLE[0]
+
+    with app.test_request_context('/?fields=' + query):
+        if selected is None:
+            with pytest.raises(BadRequest):
+                view()
+            return
+        expected = marshal(PEOPLE[0], OrderedDict(
+            (name, person_fields[name]) for name in selected))
+        assert json.dumps(view()) == json.dumps(expected)
+
+
+def test_sparse_collection_items(app):
+    collection_fields = OrderedDict([
+        ('items', fields.List(fields.Nested(person_fields))),
+        ('total', fields.Integer),
+    ])
+
+    @marshal_with(collection_fields, sparse='items')
+    def view():
+        return {'items': PEOPLE, 'total': 4}, 200, {'X-Test': '1'}
+
+    with app.test_request_context('/?fields=name,city'):
+        data, code, headers = view()
+    item_fields = OrderedDict([('name', person_fields['name']),
+                               ('city', person_fields['city'])])
+    expected = marshal({'items': PEOPLE, 'total': 4}, OrderedDict([
+        ('items', fields.List(fields.Nested(item_fields))),
+        ('total', fields.Integer),
+    ]))
+    assert json.dumps(data) == json.dumps(expected)
+    assert (code, headers) == (200, {'X-Test': '1'})
+
+    with app.test_request_context('/?fields=name,unknown'):
+        with pytest.raises(BadRequest):
+            view()
+
+
+def test_envelope(app):
+    @marshal_with(address_fields, envelope='data')
+    def view():
+        return {'street': 'Main St'}
+
+    with app.test_request_context('/'):
+        assert view() == marshal({'street': 'Main St'}, address_fields,
+                                 envelope='data')
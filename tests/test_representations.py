@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.representations."""
+
+import json
+
+import msgpack
+import pytest
+
+REPRESENTATIONS = [
+    ('application/json', json.loads),
+    ('application/msgpack', msgpack.unpackb),
+    ('application/x-msgpack', msgpack.unpackb),
+]
+
+
+@pytest.mark.parametrize('mimetype, loads', REPRESENTATIONS)
+@pytest.mark.parametrize('path', ['/api/users/1', '/api/users'])
+def test_negotiated_representation(client, user, path, mimetype, loads):
+    response = client.get(path, headers={'Accept': mimetype})
+    assert response.status_code == 200
+    assert response.mimetype == mimetype
+    assert 'Accept' in response.vary
+    body = loads(response.get_data())
+    assert user.username in (body.get('username'),
+                             body.get('items', [{}])[0].get('username'))
+
+    etag = response.headers['ETag']
+    response = client.get(path, headers={'Accept': mimetype,
+                                         'If-None-Match': etag})
+    assert response.status_code == 304
+    assert 'Accept' in response.vary
+
+
+@pytest.mark.parametrize('path', ['/api/users/1', '/api/users'])
+def test_entity_tags_differ_by_representation(client, user, path):
+    tags = dict((mimetype, client.get(path, headers={'Accept': mimetype})
+                 .headers['ETag']) for mimetype, loads in REPRESENTATIONS)
+    assert tags['application/json'] != tags['application/msgpack']
+    # Both media types name the same encoding
+    assert tags['application/msgpack'] == tags['application/x-msgpack']
+
+    # A JSON entity tag does not revalidate a MessagePack body
+    response = client.get(path, headers={
+        'Accept': 'application/msgpack',
+        'If-None-Match': tags['application/json']})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/msgpack'
+
+
+def test_default_representation_is_json(client, user):
+    response = client.get('/api/users/1', headers={'Accept': '*/*'})
+    assert response.mimetype == 'application/json'
+    assert 'Accept' in response.vary
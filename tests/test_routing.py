@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.routing, with two SQLite databases standing in for a
+primary and its replica.
+"""
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from demo import create_app
+from demo.database import db as _db
+from demo.models.user import User
+from demo.settings import TestConfig
+
+
+@pytest.fixture
+def app(tmp_path):
+    class ReplicaConfig(TestConfig):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///{0}'.format(
+            tmp_path / 'primary.db')
+        DB_REPLICA_URIS = ['sqlite:///{0}'.format(tmp_path / 'replica.db')]
+        RESPONSE_CACHE_SIZE = 0
+
+    app = create_app(ReplicaConfig)
+    context = app.app_context()
+    context.push()
+    yield app
+    context.pop()
+
+
+@pytest.fixture
+def replica(app, db, user):
+    """The replica's engine, lagging behind: its copy of the user has
+    another name.
+    """
+    engine = _db.get_engine(app, bind='replica_0')
+    _db.Model.metadata.create_all(engine)
+    row = user.snapshot()
+    row['username'] = 'alice-replica'
+    engine.execute(User.__table__.insert(), row)
+    yield engine
+    _db.Model.metadata.drop_all(engine)
+
+
+def username(session):
+    return session.execute(select([User.__table__.c.username])).scalar()
+
+
+def test_reads_of_read_requests_use_replica(app, client, replica):
+    response = client.get('/api/users/1')
+    assert response.status_code == 200
+    assert response.get_json()['username'] == 'alice-replica'
+
+    with app.test_request_context('/', method='GET'):
+        assert _db.session.get_bind(clause=select([1])) is replica
+        assert _db.session.get_bind(User.__mapper__) is replica
+        assert User.query.get(1).username == 'alice-replica'
+        _db.session.remove()
+
+
+@pytest.mark.parametrize('method', ['POST', 'PUT', 'DELETE'])
+def test_write_requests_use_primary(app, replica, method):
+    with app.test_request_context('/', method=method):
+        assert _db.session.get_bind(User.__mapper__) is not replica
+        assert username(_db.session) == 'alice'
+        _db.session.remove()
+
+
+def test_outside_requests_use_primary(app, replica):
+    assert username(_db.session) == 'alice'
+
+
+def test_flush_pins_primary(app, replica):
+    with app.test_request_context('/', method='GET'):
+        assert username(_db.session) == 'alice-replica'
+        User(username='bob', email='bob@example.com',
+             password='secret').save(commit=False)
+        _db.session.flush()
+        # The rest of the request reads its own writes
+        assert User.query.filter_by(username='bob').count() == 1
+        assert _db.session.get_bind(User.__mapper__) is not replica
+        _db.session.rollback()
+        _db.session.remove()
+
+
+def test_bulk_write_pins_primary(app, replica):
+    users = User.__table__
+    with app.test_request_context('/', method='GET'):
+        _db.session.execute(users.update().values(first_name='Alice'))
+        assert _db.session.get_bind(clause=select([1])) is not replica
+        assert _db.session.query(User.first_name).scalar() == 'Alice'
+        _db.session.rollback()
+        _db.session.remove()
+
+
+def test_unreachable_replica_falls_back_to_primary(app, client, replica,
+                                                   monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise OperationalError('connect', {}, Exception('refused'))
+    monkeypatch.setattr(replica.pool, 'connect', unreachable)
+
+    response = client.get('/api/users/1')
+    assert response.status_code == 200
+    assert response.get_json()['username'] == 'alice'
+    assert not _db.health.is_up(replica)
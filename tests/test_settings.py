@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.settings."""
+
+from sqlalchemy.pool import NullPool
+
+from demo import create_app
+from demo.metrics import MeasuredQueuePool
+from demo.settings import ProdConfig, TestConfig
+
+
+class ServerConfig(TestConfig):
+    DB_SERVER_POOL = True
+
+
+def test_engine_options_read_at_create_app(monkeypatch):
+    assert 'SQLALCHEMY_ENGINE_OPTIONS' not in vars(ProdConfig)
+
+    monkeypatch.setenv('GUNICORN_THREADS', '4')
+    monkeypatch.setenv('DB_POOL_TIMEOUT', '3')
+    options = create_app(ServerConfig).config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['poolclass'] is MeasuredQueuePool
+    assert options['pool_size'] == 4
+    assert options['pool_timeout'] == 3
+
+    monkeypatch.setenv('DB_EXTERNAL_POOLER', 'true')
+    options = create_app(ServerConfig).config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['poolclass'] is NullPool
+
+
+def test_engine_options_configured_explicitly():
+    class Config(ServerConfig):
+        SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 2}
+    app = create_app(Config)
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {'pool_size': 2}
+
+
+def test_engine_options_left_to_sqlalchemy(app):
+    assert not app.config['DB_SERVER_POOL']
+    assert app.config['SQLALCHEMY_ENGINE_OPTIONS'] == {}
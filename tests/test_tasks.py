@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""Tests for the task endpoints of demo.api.task."""
+
+import json
+
+import pytest
+from sqlalchemy import event
+
+from demo.models.task import Task
+from demo.models.user import User
+
+from .conftest import detached
+
+
+@pytest.fixture
+def task(user):
+    return detached(Task.create(user_id=user.id, summary='Write tests'))
+
+
+@pytest.fixture
+def other_task(db):
+    bob = User.create(username='bob', email='bob@example.com',
+                      password='secret')
+    return detached(Task.create(user_id=bob.id, summary="Bob's"))
+
+
+def bump_version(db, task_id):
+    """Change a task's version as another transaction would have."""
+    tasks = Task.__table__
+    db.session.execute(tasks.update().where(tasks.c.id == task_id)
+                       .values(version=tasks.c.version + 1))
+
+
+@pytest.fixture
+def concurrent_write(db):
+    """Make the next flush find its task changed by another writer."""
+    pending = [True]
+
+    def before_flush(session, flush_context, instances):
+        if pending:
+            pending.pop()
+            for instance in session.dirty:
+                bump_version(db, instance.id)
+    event.listen(db.session, 'before_flush', before_flush)
+    yield
+    event.remove(db.session, 'before_flush', before_flush)
+
+
+@pytest.mark.parametrize('method', ['get', 'post', 'delete'])
+def test_other_users_task_not_found(client, headers, other_task, method):
+    path = '/api/users/alice/tasks/{0}'.format(other_task.id)
+    response = getattr(client, method)(path, headers=headers,
+                                       json={'summary': 'Mine now'})
+    assert response.status_code == 404
+    assert Task.query.get(other_task.id).summary == "Bob's"
+
+
+def test_other_users_task_etag_not_matched(client, headers, other_task):
+    # Answering 304 would confirm the task exists and is unchanged
+    path = '/api/users/alice/tasks/{0}'.format(other_task.id)
+    response = client.get(path, headers=dict(headers, **{
+        'If-None-Match': '"{0}"'.format(other_task.etag)}))
+    assert response.status_code == 404
+
+
+def test_update_conflict(client, headers, task, concurrent_write):
+    path = '/api/users/alice/tasks/{0}'.format(task.id)
+    response = client.post(path, json={'summary': 'Renamed'},
+                           headers=headers)
+    assert response.status_code == 409
+
+    assert Task.query.get(task.id).summary == 'Write tests'
+
+
+def test_update_bumps_version(client, headers, task):
+    path = '/api/users/alice/tasks/{0}'.format(task.id)
+    response = client.post(path, json={'summary': 'Renamed'},
+                           headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['summary'] == 'Renamed'
+    assert Task.query.get(task.id).version == task.version + 1
+
+
+def batch(client, headers, operations):
+    return client.post('/api/users/alice/tasks/batch', json=operations,
+                       headers=headers)
+
+
+def test_batch_applies_mixed_operations(client, headers, user):
+    first = detached(Task.create(user_id=user.id, summary='First'))
+    second = detached(Task.create(user_id=user.id, summary='Second'))
+
+    response = batch(client, headers, [
+        {'op': 'create', 'summary': 'Third', 'complete': True},
+        {'op': 'update', 'id': first.id, 'summary': 'First, renamed'},
+        {'op': 'delete', 'id': second.id},
+    ])
+    assert response.status_code == 200
+    created, updated, deleted = response.get_json()['items']
+    assert created['op'] == 'create' and created['status'] == 201
+    assert created['version'] == 1
+    assert updated == {'op': 'update', 'status': 200, 'id': first.id,
+                       'version': 2}
+    assert deleted == {'op': 'delete', 'status': 204, 'id': second.id}
+
+    assert Task.query.get(created['id']).summary == 'Third'
+    assert Task.query.get(first.id).summary == 'First, renamed'
+    assert Task.query.get(first.id).version == 2
+    assert Task.query.get(second.id) is None
+    alice = User.query.get(user.id)
+    assert (alice.task_count, alice.open_task_count) == (2, 1)
+
+
+def test_batch_reports_invalid_operations(client, headers, task,
+                                          other_task):
+    response = batch(client, headers, [
+        {'op': 'create', 'summary': 'Fine'},
+        'not an object',
+        {'op': 'rename', 'id': task.id},
+        {'op': 'create'},
+        {'op': 'update', 'id': task.id, 'complete': 'yes'},
+        {'op': 'delete'},
+        {'op': 'delete', 'id': other_task.id},
+        {'op': 'update', 'id': task.id, 'summary': 'Twice'},
+        {'op': 'delete', 'id': task.id},
+    ])
+    assert response.status_code == 400
+    assert response.get_json() == {
+        'message': 'Invalid batch operations',
+        'errors': [
+            {'index': 1, 'message': 'Operation must be an object'},
+            {'index': 2,
+             'message': "'op' must be one of create, update, delete"},
+            {'index': 3, 'message': "Missing required parameter 'summary'"},
+            {'index': 4, 'message': "Invalid value for 'complete'"},
+            {'index': 5, 'message': "Missing required parameter 'id'"},
+            {'index': 6,
+             'message': 'Task {0} not found'.format(other_task.id)},
+            {'index': 8,
+             'message': 'Task {0} appears more than once'.format(task.id)},
+        ],
+    }
+    # Nothing was applied, not even the valid operations
+    assert Task.query.count() == 2
+    assert Task.query.get(task.id).summary == 'Write tests'
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'op': 'create', 'summary': 'Not a list'}, 400),
+    ([{'op': 'create', 'summary': 'Task'}] * 3, 413),
+])
+def test_batch_rejects_body(app, client, headers, body, status):
+    app.config['TASK_BATCH_MAX'] = 2
+    assert batch(client, headers, body).status_code == status
+    assert Task.query.count() == 0
+
+
+def test_batch_conflict_rolls_back(db, client, headers, task,
+                                   monkeypatch):
+    bulk_update = Task.bulk_update.__func__
+
+    def concurrent_bulk_update(cls, mappings, commit=True):
+        for mapping in mappings:
+            bump_version(db, mapping['id'])
+        return bulk_update(cls, mappings, commit)
+
+    monkeypatch.setattr(Task, 'bulk_update',
+                        classmethod(concurrent_bulk_update))
+    response = batch(client, headers, [
+        {'op': 'create', 'summary': 'Created'},
+        {'op': 'update', 'id': task.id, 'summary': 'Renamed'},
+    ])
+    assert response.status_code == 409
+    assert Task.query.count() == 1
+    assert Task.query.get(task.id).summary == 'Write tests'
+
+
+@pytest.fixture
+def mixed_tasks(user, other_task):
+    return [detached(Task.create(user_id=user.id, summary='Task %d' % i,
+                                 complete=i % 2 == 0))
+            for i in range(5)]
+
+
+@pytest.mark.parametrize('complete, expected', [
+    (None, [0, 1, 2, 3, 4]),
+    ('1', [0, 2, 4]),
+    ('true', [0, 2, 4]),
+    ('True', [0, 2, 4]),
+    ('0', [1, 3]),
+    ('false', [1, 3]),
+])
+def test_collection_filters_complete(client, headers, mixed_tasks,
+                                     complete, expected):
+    url = '/api/users/alice/tasks'
+    if complete is not None:
+        url += '?complete=' + complete
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [item['id'] for item in body['items']] == \
+        [mixed_tasks[i].id for i in expected]
+    assert body['meta']['total'] == len(expected)
+
+
+def test_collection_rejects_bad_complete(client, headers, mixed_tasks):
+    response = client.get('/api/users/alice/tasks?complete=maybe',
+                          headers=headers)
+    assert response.status_code == 400
+
+
+def test_export_filters_complete(client, headers, mixed_tasks):
+    response = client.get('/api/users/alice/tasks/export?complete=false',
+                          headers=headers)
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line)['id'] for line in lines] == \
+        [mixed_tasks[1].id, mixed_tasks[3].id]
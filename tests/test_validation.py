@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Tests for demo.validation: BodyParser parses and fails like
+flask_restful.reqparse.RequestParser.
+"""
+
+import pytest
+from flask_restful import reqparse
+from werkzeug.exceptions import HTTPException
+
+from demo.validation import BodyParser
+
+ARGUMENTS = [
+    ('summary', {'type': str, 'required': True}),
+    ('complete', {'type': bool}),
+    ('count', {'type': int}),
+    ('description', {}),
+]
+
+
+def parsers():
+    request_parser, body_parser = reqparse.RequestParser(), BodyParser()
+    for name, options in ARGUMENTS:
+        request_parser.add_argument(name, **options)
+        body_parser.add_argument(name, **options)
+    return request_parser, body_parser
+
+
+def outcome(app, parser, **request):
+    """Return ``(status, result)``: 200 and the parsed arguments, minus
+    those not sent, or the error status and message.
+    """
+    with app.test_request_context('/', method='POST', **request):
+        try:
+            parsed = parser.parse_args()
+        except HTTPException as error:
+            return error.code, error.data['message']
+    return 200, dict((name, value) for name, value in parsed.items()
+                     if value is not None)
+
+
+@pytest.mark.parametrize('request_kwargs', [
+    # Valid bodies
+    {'json': {'summary': 'Write docs'}},
+    {'json': {'summary': 'Write docs', 'complete': True, 'count': 3,
+              'description': u'All of them \u2713'}},
+    {'json': {'summary': 'Write docs', 'count': '3'}},
+    {'json': {'summary': 'Write docs', 'complete': 'false'}},
+    {'json': {'summary': 'Write docs', 'description': None}},
+    {'json': {'summary': 'Write docs'}, 'query_string': {'count': '4'}},
+    {'json': {'count': 4}, 'query_string': {'summary': 'From the URL'}},
+    # Unknown arguments are ignored
+    {'json': {'summary': 'Write docs', 'priority': 'high'}},
+    {'json': {'summary': 'Write docs'}, 'query_string': {'owner': 'bob'}},
+    # Missing required argument
+    {'json': {}},
+    {'json': {'complete': True, 'unknown': 'summary'}},
+    # Wrong type
+    {'json': {'summary': 'Write docs', 'count': 'three'}},
+    {'json': {'summary': 'Write docs', 'count': 1.5}},
+    {'json': {'summary': 'Write docs', 'count': {}}},
+    {'json': {'summary': 'Write docs'}, 'query_string': {'count': '1.5'}},
+])
+def test_matches_reqparse(app, request_kwargs):
+    request_parser, body_parser = parsers()
+    expected = outcome(app, request_parser, **request_kwargs)
+    assert outcome(app, body_parser, **request_kwargs) == expected
+
+
+MISSING = {'summary': 'Missing required parameter in the JSON body or the '
+                      'post body or the query string'}
+
+
+def test_missing_required_argument(app):
+    assert outcome(app, parsers()[1], json={}) == (400, MISSING)
+
+
+def test_wrong_type(app):
+    assert outcome(app, parsers()[1], json={
+        'summary': 'Write docs', 'count': 'three'}) == (
+        400, {'count': "invalid literal for int() with base 10: 'three'"})
+
+
+@pytest.mark.parametrize('request_kwargs, expected', [
+    # Forms, which reqparse only reads on Flask < 2.1: newer versions
+    # refuse to look for JSON in them
+    ({'data': {'summary': 'From a form', 'count': '2'}},
+     (200, {'summary': 'From a form', 'count': 2})),
+    ({'data': {'description': 'No summary'}}, (400, MISSING)),
+    ({}, (400, MISSING)),
+    # null counts as missing, where reqparse would pass None on
+    ({'json': {'summary': None}}, (400, MISSING)),
+    # reqparse fails with a 500 on bodies that are not objects
+    ({'json': ['not', 'an', 'object']}, (400, MISSING)),
+])
+def test_differences_from_reqparse(app, request_kwargs, expected):
+    assert outcome(app, parsers()[1], **request_kwargs) == expected
+
+
+def test_list_for_single_value(app):
+    # reqparse would take the list's first item
+    status, message = outcome(app, parsers()[1], json={
+        'summary': 'Write docs', 'count': [1, 2]})
+    assert status == 400
+    assert list(message) == ['count']